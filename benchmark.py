@@ -0,0 +1,393 @@
+import argparse
+import contextlib
+import datetime
+import email.utils
+import gzip
+import hashlib
+import http.server
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+"""
+Offline benchmark of the forecast stages (STAC discovery, metadata lookup, parameter download and parsing,
+data collection, rendering and marking) with synthetic data of the size MeteoSwiss publishes.
+The fixtures get generated once into a directory and are served by a local HTTP server, no network access is needed.
+Every scenario runs in a fresh process, so imports and in-memory caches are cold like in a cron job.
+"""
+
+# Forecast run of the fixtures, a fixed date keeps the results comparable
+fixtureRun = "202510180600"
+fixtureVersion = 1 # increase when the generated fixtures change
+
+# Parameters listed in the STAC item, the CSV files only get generated for the ones which get loaded
+stacParameters = ['tre200h0', 'treq10h0', 'treq90h0', 'rre150h0', 'rreq10h0', 'rreq90h0', 'fu3010h0', 'fu3010h1', 'sre000h0', 'jww003i0',
+                  'tde200h0', 'ure200h0', 'dkl010h0', 'pp0qffh0', 'rp0003i0', 'nprolohs', 'nprom1hs', 'nprohihs', 'ssohs', 'zfre00hs']
+loadedParameters = ['tre200h0', 'treq10h0', 'treq90h0', 'rre150h0', 'rreq10h0', 'rreq90h0', 'fu3010h0', 'sre000h0', 'jww003i0']
+forecastHours = 9 * 24 + 10 # hours of data per point and parameter
+
+# Point types of the metadata: stations, zip codes and other locations (eg. mountains)
+stationPoints = 160
+zipCodePoints = 3200
+
+"""
+Scenarios: name -> options
+locations: Number of zip codes, flags: collectData()/generateGraph() options
+"""
+scenarios = {
+    'single': dict(locations=1, flags={}),
+    'locations50': dict(locations=50, flags={}),
+    'allFlags': dict(locations=1, flags={'minMaxTemperature': True, 'rainVariance': True, 'showSunshine': True}),
+}
+
+
+# Returns the zip codes of the generated points
+def getFixtureZipCodes(points):
+    return [1000 + i * 2 for i in range(min(zipCodePoints, points))]
+
+
+def _writePointMeta(directory, points):
+    zipCodes = getFixtureZipCodes(points)
+    with open(os.path.join(directory, "meta.csv"), "w", encoding="latin1", newline="") as f:
+        f.write("point_id;point_type_id;station_abbr;postal_code;point_name;point_height_masl;point_coordinates_lv95_east;point_coordinates_lv95_north;point_coordinates_wgs84_lat;point_coordinates_wgs84_lon\n")
+        for i in range(points):
+            rng = random.Random(i)
+            lat, lon = 45.8 + rng.random() * 2, 5.9 + rng.random() * 4.6
+            east, north = int(2485000 + (lon - 5.9) * 76000), int(1075000 + (lat - 45.8) * 111000)
+            if i < len(zipCodes):
+                row = (str(100000 + i), "2", "", str(zipCodes[i]), "Zürich %d" % zipCodes[i])
+            elif i < len(zipCodes) + stationPoints:
+                row = (str(100000 + i), "1", "S%03d" % i, "", "Station %d" % i)
+            else:
+                row = (str(100000 + i), "3", "", "", "Piz %d" % i)
+            f.write("%s;%d;%d;%d;%.5f;%.5f\n" % (";".join(row), 300 + rng.randrange(3000), east, north, lat, lon))
+
+
+def _parameterValues(parameter, pointIndex, hour):
+    # Daily cycle per point, with some weather coming through
+    phase = pointIndex % 7
+    daily = math.sin((hour % 24 - 9) / 24 * 2 * math.pi)
+    weather = math.sin(hour / 31.0 + phase)
+    if parameter.startswith('tre') or parameter.startswith('treq'):
+        spread = {'treq10h0': -1.5 - hour / 60, 'treq90h0': 1.5 + hour / 60}.get(parameter, 0)
+        return "%.1f" % (8 + 6 * daily + 3 * weather + phase + spread)
+    if parameter.startswith('rre'):
+        rain = max(0.0, 2.5 * weather - 1)
+        factor = {'rreq10h0': 0.3, 'rreq90h0': 2.2}.get(parameter, 1)
+        return "%.1f" % (rain * factor)
+    if parameter == 'fu3010h0':
+        return "%.1f" % (8 + 6 * abs(weather))
+    if parameter == 'sre000h0':
+        return "%d" % max(0, int(60 * daily * (1 - max(0, weather))))
+    if parameter == 'jww003i0':
+        symbol = 1 + int(abs(weather) * 30) % 35
+        return "%d" % (symbol + 100 if hour % 24 < 6 or hour % 24 >= 20 else symbol)
+    return "0"
+
+
+def _writeParameter(directory, parameter, points):
+    start = datetime.datetime.strptime(fixtureRun, "%Y%m%d%H%M") + datetime.timedelta(hours=1)
+    dates = [(start + datetime.timedelta(hours=h)).strftime("%Y%m%d%H%M") for h in range(forecastHours)]
+    zipCodeCount = len(getFixtureZipCodes(points))
+    with open(os.path.join(directory, getAssetName(parameter)), "w", encoding="latin1", newline="") as f:
+        f.write("point_id;point_type_id;Date;%s\n" % parameter)
+        for i in range(points):
+            pointType = "2" if i < zipCodeCount else "1" if i < zipCodeCount + stationPoints else "3"
+            prefix = "%d;%s;" % (100000 + i, pointType)
+            f.write("".join("%s%s;%s\n" % (prefix, date, _parameterValues(parameter, i, h)) for h, date in enumerate(dates)))
+
+
+def getAssetName(parameter):
+    return "vnut12.lssw.%s.%s.csv" % (fixtureRun, parameter)
+
+
+def _writeStacItems(directory):
+    # The asset URLs point to the server, "{baseUrl}" gets replaced when serving the items
+    features = []
+    for runOffset in range(8):
+        run = (datetime.datetime.strptime(fixtureRun, "%Y%m%d%H%M") - datetime.timedelta(hours=3 * runOffset)).strftime("%Y%m%d%H%M")
+        assets = {}
+        for parameter in stacParameters:
+            name = "vnut12.lssw.%s.%s.csv" % (run, parameter)
+            assets[name] = {"href": "{baseUrl}/" + name, "type": "text/csv", "file:size": 40000000}
+        features.append({"type": "Feature", "id": "ch.meteoschweiz.ogd-local-forecasting-%s" % run[:8], "assets": assets})
+    with open(os.path.join(directory, "items.json"), "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+"""
+Generates the fixtures (point metadata, STAC items and parameter CSVs of all points) unless they already exist with the same settings.
+"""
+def generateFixtures(directory, points):
+    settingsFile = os.path.join(directory, "fixtures.json")
+    settings = {'version': fixtureVersion, 'run': fixtureRun, 'points': points}
+    try:
+        with open(settingsFile) as f:
+            if json.load(f) == settings:
+                logging.info("Using the fixtures in %s" % directory)
+                return
+    except (OSError, ValueError):
+        pass
+
+    logging.info("Generating fixtures with %d points in %s..." % (points, directory))
+    os.makedirs(directory, exist_ok=True)
+    _writePointMeta(directory, points)
+    _writeStacItems(directory)
+    for parameter in loadedParameters:
+        logging.debug("Generating %s..." % parameter)
+        _writeParameter(directory, parameter, points)
+    with open(settingsFile, "w") as f:
+        json.dump(settings, f)
+
+
+"""
+Serves the fixtures like data.geo.admin.ch: /items (STAC), /meta.csv and the parameter CSVs, with ETag/Last-Modified and gzip.
+"""
+class FixtureRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real server
+    directory = None
+    compressed = {} # path -> gzip content, every file only gets compressed once
+
+
+    def do_GET(self):
+        path = self.path.split('?')[0].lstrip('/')
+        if path == "items":
+            with open(os.path.join(self.directory, "items.json")) as f:
+                content = f.read().replace("{baseUrl}", "http://%s:%d" % self.server.server_address).encode('utf-8')
+            mtime = os.path.getmtime(os.path.join(self.directory, "items.json"))
+        else:
+            fileName = os.path.join(self.directory, os.path.basename(path))
+            if not path or not os.path.isfile(fileName):
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            with open(fileName, 'rb') as f:
+                content = f.read()
+            mtime = os.path.getmtime(fileName)
+
+        etag = '"%s"' % hashlib.sha1(content).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', email.utils.formatdate(mtime, usegmt=True))
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            if (path, etag) not in self.compressed:
+                self.compressed[(path, etag)] = gzip.compress(content, 6)
+            content = self.compressed[(path, etag)]
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serveFixtures(directory, connection):
+    FixtureRequestHandler.directory = directory
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FixtureRequestHandler)
+    connection.send(server.server_address[1])
+    server.serve_forever()
+
+
+"""
+Starts the fixture server in its own process (so it does not share the CPU time of the measured process).
+Returns the process and the base URL.
+"""
+def startFixtureServer(directory):
+    parentConnection, childConnection = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serveFixtures, args=(directory, childConnection), daemon=True)
+    process.start()
+    port = parentConnection.recv()
+    return process, "http://127.0.0.1:%d" % port
+
+
+"""
+Collects the wall time, CPU time (all threads of the process) and the peak memory of the stages.
+"""
+class StageTimer:
+
+    def __init__(self):
+        self.stages = []
+
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        yield
+        self.stages.append({
+            'stage': name,
+            'wall': time.perf_counter() - wall,
+            'cpu': time.process_time() - cpu,
+            'peakRss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, # MB, the peak of the process so far
+        })
+
+
+"""
+Runs the stages of a scenario in this process and returns their measurements.
+"""
+def runScenario(name, baseUrl, cacheDirectory=None, forecastStore=False, outputDirectory=None):
+    scenario = scenarios[name]
+    flags = scenario['flags']
+    timer = StageTimer()
+    logging.getLogger("matplotlib").setLevel(logging.WARNING)
+    logging.getLogger("PIL").setLevel(logging.WARNING)
+
+    with timer.stage("import"):
+        import meteoswissForecast
+    meteoswissForecast.MeteoSwissForecast.stacCollectionUrl = baseUrl
+    meteoswissForecast.MeteoSwissForecast.pointMetaUrl = baseUrl + "/meta.csv"
+    meteoswissForecast.setCacheDirectory(cacheDirectory)
+    if forecastStore and cacheDirectory:
+        meteoswissForecast.setForecastStoreDirectory(os.path.join(cacheDirectory, "store"))
+
+    zipCodes = getFixtureZipCodes(zipCodePoints)[:scenario['locations']]
+    with timer.stage("metadataLookup"):
+        forecasts = meteoswissForecast.createForecasts(zipCodes, utcOffset=2)
+    with timer.stage("stacDiscovery"):
+        run = forecasts[0].getLatestForecastRun()
+    with timer.stage("loadParameterSeries"):
+        forecasts[0].loadParameterSeries(forecasts[0].getParameterAssetUrl('tre200h0', run), 'tre200h0')
+
+    collectOptions = dict(daysToUse=4, showSunshine=flags.get('showSunshine', False), rainVariance=flags.get('rainVariance', False))
+    with timer.stage("collectData"):
+        if len(forecasts) == 1:
+            dataOfLocations = {forecasts[0].zipCode: forecasts[0].collectData(forecastDataUrl=run, **collectOptions)}
+        else:
+            dataOfLocations = meteoswissForecast.collectDataForLocations(forecasts, forecastDataUrl=run, **collectOptions)
+
+    with timer.stage("importGraph"):
+        import forecastGraph
+    graphFiles = []
+    renderContext = forecastGraph.GraphRenderContext()
+    with timer.stage("generateGraph"):
+        for forecast in forecasts:
+            graphFile = os.path.join(outputDirectory, "forecast-%d.png" % forecast.zipCode)
+            metaFile = os.path.join(outputDirectory, "meta-%d.json" % forecast.zipCode)
+            forecast.generateGraph(data=dataOfLocations[forecast.zipCode], outputFilename=graphFile, writeMetaData=metaFile, renderContext=renderContext,
+                                   minMaxTemperature=flags.get('minMaxTemperature', False), rainVariance=collectOptions['rainVariance'], showSunshine=collectOptions['showSunshine'])
+            graphFiles.append((graphFile, metaFile))
+
+    import markGraphic
+    graphFile, metaFile = graphFiles[0]
+    with open(metaFile) as f:
+        firstDay = json.load(f)['firstDayTimestamp']
+    marker = markGraphic.GraphicMarker(graphFile, os.path.join(outputDirectory, "marked.png"), metaFile=metaFile)
+    with timer.stage("markGraphic"):
+        marker.mark(now=firstDay + 12 * 3600)
+    with timer.stage("markGraphicUpdate"):
+        marker.mark(now=firstDay + 13 * 3600)
+    return timer.stages
+
+
+"""
+Runs a scenario in a fresh process and returns its measurements.
+"""
+def runScenarioProcess(name, baseUrl, cacheDirectory=None, forecastStore=False):
+    with tempfile.TemporaryDirectory() as outputDirectory:
+        command = [sys.executable, os.path.abspath(__file__), "--child", name, "--base-url", baseUrl, "--output-dir", outputDirectory]
+        if cacheDirectory:
+            command += ["--cache-dir", cacheDirectory]
+        if forecastStore:
+            command += ["--forecast-store"]
+        result = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout.decode('utf-8').strip().splitlines()[-1])
+
+
+"""
+Runs every scenario the given number of times and returns {scenario: [{stage, wall, cpu, peakRss}, ...]}
+with the median of the times and the maximum of the memory.
+cache: "none" (every download hits the server), "warm" (a first untimed run fills the disk cache)
+"""
+def runBenchmark(baseUrl, scenarioNames, repeat=3, cache="none", forecastStore=False):
+    results = {}
+    for name in scenarioNames:
+        cacheDirectory = tempfile.mkdtemp(prefix="meteoswiss-benchmark-cache-") if cache == "warm" else None
+        try:
+            if cacheDirectory:
+                runScenarioProcess(name, baseUrl, cacheDirectory, forecastStore)
+            runs = [runScenarioProcess(name, baseUrl, cacheDirectory, forecastStore) for i in range(repeat)]
+        finally:
+            if cacheDirectory:
+                shutil.rmtree(cacheDirectory, ignore_errors=True)
+
+        stages = []
+        for i, stage in enumerate(runs[0]):
+            samples = [run[i] for run in runs]
+            stages.append({
+                'stage': stage['stage'],
+                'wall': statistics.median(sample['wall'] for sample in samples),
+                'cpu': statistics.median(sample['cpu'] for sample in samples),
+                'peakRss': max(sample['peakRss'] for sample in samples),
+            })
+        results[name] = stages
+    return results
+
+
+def printResults(results):
+    for name, stages in results.items():
+        print("\n%s" % name)
+        print("  %-22s %10s %10s %12s" % ("stage", "wall ms", "cpu ms", "peak RSS MB"))
+        for stage in stages:
+            print("  %-22s %10.1f %10.1f %12.1f" % (stage['stage'], stage['wall'] * 1000, stage['cpu'] * 1000, stage['peakRss']))
+        print("  %-22s %10.1f %10.1f" % ("total", sum(stage['wall'] for stage in stages) * 1000, sum(stage['cpu'] for stage in stages) * 1000))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmark of the forecast stages with synthetic MeteoSwiss data served by a local HTTP server')
+    parser.add_argument('-v', action='store_true', help='Verbose output')
+    parser.add_argument('--scenario', action='store', nargs='+', choices=list(scenarios), default=list(scenarios), help='Scenarios to run, default: all')
+    parser.add_argument('--repeat', action='store', type=int, default=3, help='Runs per scenario, the median gets reported')
+    parser.add_argument('--points', action='store', type=int, default=6000, help='Number of points in the generated data (MeteoSwiss publishes about 6000)')
+    parser.add_argument('--fixtures', action='store', default=os.path.join(tempfile.gettempdir(), "meteoswiss-forecast-benchmark"), help='Directory of the generated fixtures, they get reused by further runs')
+    parser.add_argument('--cache', action='store', choices=["none", "warm"], default="none", help='"none": download everything, "warm": measure with a filled disk cache')
+    parser.add_argument('--forecast-store', action='store_true', help='Use the memory-mapped forecast store (with --cache warm)')
+    parser.add_argument('--json', action='store', help='Also write the results to this JSON file, eg. to compare them later')
+    # Used internally to run a scenario in a fresh process
+    parser.add_argument('--child', action='store', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', action='store', help=argparse.SUPPRESS)
+    parser.add_argument('--cache-dir', action='store', help=argparse.SUPPRESS)
+    parser.add_argument('--output-dir', action='store', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    logLevel = logging.INFO
+    if args.v:
+        logLevel = logging.DEBUG
+    logging.basicConfig(format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%d-%b-%y %H:%M:%S', level=logLevel, stream=sys.stderr)
+
+    if args.child:
+        stages = runScenario(args.child, args.base_url, cacheDirectory=args.cache_dir, forecastStore=args.forecast_store, outputDirectory=args.output_dir)
+        print(json.dumps(stages))
+        exit(0)
+
+    generateFixtures(args.fixtures, args.points)
+    serverProcess, baseUrl = startFixtureServer(args.fixtures)
+    try:
+        results = runBenchmark(baseUrl, args.scenario, repeat=args.repeat, cache=args.cache, forecastStore=args.forecast_store)
+    finally:
+        serverProcess.terminate()
+
+    printResults(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'points': args.points, 'cache': args.cache, 'forecastStore': args.forecast_store, 'results': results}, f, indent=1)
@@ -0,0 +1,70 @@
+import numpy as np
+
+
+# Helpers working on the data returned by MeteoSwissForecast.collectData(), without any plotting dependencies.
+
+
+# Meteoswiss only provides the data of the up to 9 days.
+maximumNumberOfDays = 9
+
+
+"""
+Returns a copy of the data returned by collectData(), limited to the given number of days.
+The result is the same as when collectData() got called with daysToUse set to that number.
+"""
+def limitDataToDays(data, days):
+    if days >= data["noOfDays"]:
+        return dict(data)
+    count = days * 24
+    if days < maximumNumberOfDays and len(data["timestamps"]) > count:
+        count += 1 # collectData() adds the first hour of the next day
+    endTimestamp = data["timestamps"][days * 24] if len(data["timestamps"]) > days * 24 else None
+    limitedData = dict(data)
+    limitedData["noOfDays"] = days
+    limitedData["dayNames"] = data["dayNames"][:days]
+    for field in ["timestamps", "formatedTime", "rainfall", "rainfallVarianceMin", "rainfallVarianceMax", "temperature", "temperatureVarianceMin", "temperatureVarianceMax", "wind", "sunshine"]:
+        limitedData[field] = data[field][:count]
+    if endTimestamp is not None:
+        symbols = [i for i, timestamp in enumerate(data["symbolsTimestamps"]) if timestamp < endTimestamp]
+        limitedData["symbols"] = [data["symbols"][i] for i in symbols]
+        limitedData["symbolsTimestamps"] = [data["symbolsTimestamps"][i] for i in symbols]
+    return limitedData
+
+
+"""
+Returns the minimum and maximum temperature of every day of the data returned by collectData().
+The first hour of the next day (00:00) counts to the day as well, except on the last day of the forecast.
+Result: {"min": {...}, "max": {...}}, each with the arrays (one entry per day) "index" (hour in the data, -1 if the day has no data), "timestamp" and "temperature" (NaN if the day has no data).
+pixelScale: Optional (x pixels per day, temperature scale min, temperature scale max, height in pixel) of a graph, adds the arrays "xpixel" and "ypixel".
+"""
+def getDailyMinMaxTemperatures(data, pixelScale=None):
+    days = data["noOfDays"]
+    count = days * 24 + 1
+    available = min(count, len(data["temperature"]))
+    temperature = np.full(count, np.nan)
+    temperature[:available] = np.array(data["temperature"][:available], dtype=float)
+    timestamps = np.full(count, np.nan)
+    timestamps[:available] = np.array(data["timestamps"][:available], dtype=float)
+
+    # days x 25 hours, from 00:00 to 00:00 of the next day
+    hours = np.arange(days)[:, None] * 24 + np.arange(25)[None, :]
+    window = temperature[hours]
+    if days >= maximumNumberOfDays:
+        window[maximumNumberOfDays - 1:, 24] = np.nan # The last day has no next day
+    hasData = ~np.isnan(window).all(axis=1)
+
+    extremes = {}
+    for name, missing, argFunction in (("min", np.inf, np.argmin), ("max", -np.inf, np.argmax)):
+        # The first occurrence wins, like that the 00:00 of the next day only counts if it is a new extreme
+        index = hours[np.arange(days), argFunction(np.where(np.isnan(window), missing, window), axis=1)]
+        extreme = {
+            "index": np.where(hasData, index, -1),
+            "timestamp": np.where(hasData, timestamps[index], np.nan),
+            "temperature": np.where(hasData, temperature[index], np.nan),
+        }
+        if pixelScale:
+            xPixelsPerDay, temperatureScaleMin, temperatureScaleMax, height = pixelScale
+            extreme["xpixel"] = (extreme["timestamp"] - timestamps[0]) / (24*3600) * xPixelsPerDay
+            extreme["ypixel"] = (extreme["temperature"] - temperatureScaleMin) / (temperatureScaleMax - temperatureScaleMin) * height
+        extremes[name] = extreme
+    return extremes
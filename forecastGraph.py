@@ -0,0 +1,639 @@
+import concurrent.futures
+import datetime
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import numpy as np
+from PIL import Image
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PatchCollection, PolyCollection
+from matplotlib.patches import Circle, Rectangle
+from matplotlib.offsetbox import DrawingArea, OffsetImage, AnnotationBbox
+import matplotlib.patheffects as path_effects
+from matplotlib.ticker import FormatStrFormatter
+from scipy import interpolate
+import forecastData
+import forecastMetrics
+import imageEncoder
+import weatherSymbols
+
+
+# Rendering of the forecast graphs. Only this module depends on matplotlib/scipy, the data part (meteoswissForecast.py) does not.
+
+
+# Extents of the measured texts: (text, font size, weight, DPI) -> extent, see GraphRenderContext.measureText()
+_textExtents = {}
+
+# Part of the content fingerprint, needs to be increased when the rendering changes so that existing graphs get replaced
+fingerprintVersion = 1
+
+# Decoded and resampled weather symbols, see setSymbolAtlasDirectory()
+_symbolCache = weatherSymbols.SymbolCache()
+
+
+# Sets the directory used to store the resampled weather symbols as one atlas file per scale, None disables the atlas.
+def setSymbolAtlasDirectory(directory):
+    global _symbolCache
+    _symbolCache = weatherSymbols.SymbolCache(atlasDirectory=directory)
+
+
+"""
+Generates the graphic containing the forecast and returns its meta data
+renderContext: Optional GraphRenderContext, keeps the figure of the layout for further renders
+imageFormat: Encoding of the output file, eg. "png:level=9" or "webp", see imageEncoder.parseImageFormat()
+returnImage: Also return the rendered image, the result then is the tuple (meta data, image):
+             "array": RGBA pixels as NumPy array, "image": PIL image, "bytes": encoded in the image format
+skipUnchanged: Keep the output and meta file (including their modification time) if they already show the same content,
+               see getContentFingerprint(). Needs outputFilename and writeMetaData.
+The phases of the rendering get timed as spans "generateGraph.<phase>", see forecastMetrics.py.
+"""
+@forecastMetrics.timed("generateGraph")
+def generateGraph(forecast, data=None, outputFilename=None, timeDivisions=6, graphWidth=1920, graphHeight=300, darkMode=False, rainVariance=False, minMaxTemperature=False, fontSize=12, symbolZoom=1.0, symbolDivision=1, showCityName=False, hideDataCopyright=False, writeMetaData=None, progressCallback=None, measuredRain=None, measuredTemperature=None, showSunshine=False, sunshineBars=False, renderContext=None, imageFormat=None, returnImage=None, skipUnchanged=False):
+    if returnImage not in (None, "array", "image", "bytes"):
+        raise Exception("Unknown returnImage %r, use \"array\", \"image\" or \"bytes\"" % returnImage)
+    if skipUnchanged and not (outputFilename and writeMetaData):
+        raise Exception("skipUnchanged needs the outputFilename and writeMetaData")
+    imageEncoder.parseImageFormat(imageFormat) # fail before rendering
+    if progressCallback:
+        progressCallback("0%")
+
+    logging.debug("Initializing graph...")
+    if darkMode:
+        colors = forecast.colorsDarkMode
+    else:
+        colors = forecast.colorsLightMode
+
+    if not graphWidth:
+        graphWidth = 1280
+    if not graphHeight:
+        graphHeight = 300
+    logging.debug("Graph size: %d x %d pixel" % (graphWidth, graphHeight))
+
+    renderOptions = dict(timeDivisions=timeDivisions, graphWidth=graphWidth, graphHeight=graphHeight, darkMode=darkMode, rainVariance=rainVariance, minMaxTemperature=minMaxTemperature, fontSize=fontSize, symbolZoom=symbolZoom, symbolDivision=symbolDivision, showCityName=showCityName, hideDataCopyright=hideDataCopyright,
+                         measuredRain=measuredRain, measuredTemperature=measuredTemperature, showSunshine=showSunshine, sunshineBars=sunshineBars, imageFormat=imageEncoder.parseImageFormat(imageFormat))
+    forecastMetrics.phase("fingerprint")
+    fingerprint = getContentFingerprint(forecast, data, renderOptions)
+    if skipUnchanged:
+        metaData = _getUnchangedMetaData(forecast, outputFilename, writeMetaData, fingerprint)
+        if metaData is not None:
+            logging.debug("%s is up to date, skipping it" % outputFilename)
+            forecastMetrics.phase("skipped")
+            if progressCallback:
+                progressCallback("100%")
+            if returnImage:
+                return metaData, _readImage(outputFilename, metaData, imageFormat, returnImage)
+            return metaData
+
+    forecastMetrics.phase("layout")
+    context = renderContext if renderContext else GraphRenderContext()
+    layout = (graphWidth, graphHeight, darkMode, fontSize, data["noOfDays"], rainVariance, showCityName, hideDataCopyright, forecast.cityName if showCityName else None)
+    if context.layout != layout:
+        context.close()
+        _buildGraphScaffold(forecast, context, layout, colors)
+    else:
+        logging.debug("Reusing the graph layout")
+        context.clear()
+
+    fig = context.fig
+    rainAxis = context.rainAxis
+    temperatureAxis = context.temperatureAxis
+    temperatureVarianceAxis = context.temperatureVarianceAxis
+    width, height = context.width, context.height
+    xPixelsPerDay = context.xPixelsPerDay
+    add = context.add
+
+    # Show gray background on every 2nd day
+    for day in range(0, data["noOfDays"], 2):
+        add(rainAxis.axvspan(data["timestamps"][0 + day * 24], data["timestamps"][23 + day * 24] + 3600, facecolor='gray', alpha=0.2))
+
+
+    # Time axis and ticks
+    rainAxis.set_xticks(data["timestamps"][::timeDivisions])
+    rainAxis.set_xticklabels(data["formatedTime"][::timeDivisions])
+
+    # Rain (data gets splitted to stacked bars)
+    logging.debug("Creating rain plot...")
+    if progressCallback:
+        progressCallback("20%")
+    forecastMetrics.phase("rain")
+
+    rainBars = getRainBars(forecast, data["timestamps"], data["rainfall"])
+
+    rainScaleMax = max(data["rainfall"]) + 1 # Add a bit to make sure we do not bang our head
+
+    # Sunshine visualization (drawn before rain to be behind)
+    if showSunshine and "sunshine" in data:
+        maxSunshineHeight = 0.99 * rainScaleMax
+        sunshineHeight = [min(s / 60.0, 0.99) * maxSunshineHeight for s in data["sunshine"]]
+        if sunshineBars:
+            sunshinePatches = [Rectangle((t, 0), 3000, h, facecolor='#e8b400', edgecolor='none') for t, h in zip(data["timestamps"], sunshineHeight)]
+            add(rainAxis.add_collection(PatchCollection(sunshinePatches, match_original=True, zorder=1)))
+        else:
+            # Center the sunshine line/fill on each hour
+            lineTimestamps = [t + 1800 for t in data["timestamps"]]
+            # Create smooth spline interpolation
+            timestamps = np.array(lineTimestamps)
+            sunshine = np.array(sunshineHeight)
+            # Use spline interpolation for smooth curve
+            spline = interpolate.make_interp_spline(timestamps, sunshine, k=3)
+            smooth_timestamps = np.linspace(timestamps.min(), timestamps.max(), 100)
+            smooth_sunshine = spline(smooth_timestamps)
+            # Clamp to maximum height to prevent spline overshoot
+            smooth_sunshine = np.clip(smooth_sunshine, 0, maxSunshineHeight)
+            add(rainAxis.fill_between(smooth_timestamps, 0, smooth_sunshine, color='#fff3b0', alpha=0.5, zorder=1))
+            add(rainAxis.plot(smooth_timestamps, smooth_sunshine, color='#e8b400', linewidth=2, zorder=2)[0])
+
+    if rainBars is not None:
+        add(rainAxis.add_collection(rainBars))
+
+    if measuredRain:
+        measRainTime, measRain = measuredRain
+        measRainTime = [t + forecast.utcOffset * 3600 for t in measRainTime]
+        rainScaleMax = max(rainScaleMax, max(measRain) + 1)
+
+
+    rainAxis.set_ylim(0, rainScaleMax)
+
+    # Rain color bar as y axis
+    rainAxis.set_xlim(data["timestamps"][0], data["timestamps"][-2] + (data["timestamps"][1] - data["timestamps"][0]))
+    pixelToRainX = 1 / xPixelsPerDay * (data["timestamps"][23] - data["timestamps"][0])
+    x = data["timestamps"][-2] + (data["timestamps"][1] - data["timestamps"][0]) # end of x
+    w = 7 * pixelToRainX
+
+    for i in range(0, len(forecast.rainColorSteps)):
+        y = forecast.rainColorSteps[i] - forecast.rainColorStepSizes[i]
+        if y > rainScaleMax:
+            break
+        h = forecast.rainColorSteps[i] + forecast.rainColorStepSizes[i]
+        if y + h >= rainScaleMax: # reached top
+            h = rainScaleMax - y
+        rainScaleBar = Rectangle((x, y), w, h, fc=forecast.rainColors[i], alpha=1)
+        add(rainAxis.add_patch(rainScaleBar))
+        rainScaleBar.set_clip_on(False)
+
+    rainScaleBorder = Rectangle((x, 0), w, rainScaleMax, fc="black", fill=False, alpha=1)
+    add(rainAxis.add_patch(rainScaleBorder))
+    rainScaleBorder.set_clip_on(False)
+
+    # Rain variance
+    if rainVariance:
+        rainfallVarianceAxis = context.rainfallVarianceAxis
+
+        timestampsCentered = [i + 1500 for i in data["timestamps"]]
+        # Use original variance data directly
+        rainfallVarianceMin = data["rainfallVarianceMin"]
+        rainfallVarianceMax = data["rainfallVarianceMax"]
+
+        # Calculate variance ranges for errorbar
+        errorbarMin = np.subtract(np.array(data["rainfall"]), np.array(rainfallVarianceMin))
+        errorbarMin = [max(0, x) for x in errorbarMin]
+        errorbarMax = np.subtract(np.array(rainfallVarianceMax), np.array(data["rainfall"]))
+        errorbarMax = [max(0, x) for x in errorbarMax]
+
+        # rainfallVarianceAxis.errorbar(timestampsCentered, data["rainfall"], yerr=[errorbarMin, errorbarMax],
+                # fmt="none", elinewidth=1, alpha=0.5, ecolor='darkgray', capsize=3)
+        # Add variance bar starting from rainfallVarianceMin to rainfallVarianceMax
+        varianceRange = np.subtract(rainfallVarianceMax, rainfallVarianceMin)
+        add(rainfallVarianceAxis.bar(timestampsCentered, varianceRange,
+                bottom=rainfallVarianceMin, width=3000, fill=False, edgecolor='darkgray', linewidth=1, alpha=0.5, zorder=4))
+        rainfallVarianceAxis.set_ylim(0, rainScaleMax)
+
+
+    # Show when the model was last calculated
+    # The model run time is an end-of-hour timestamp, so shift it back by one hour
+    # to align with the start-of-hour display convention used for the forecast data.
+    timestampLocal = data["modelCalculationTimestamp"] + forecast.utcOffset * 3600 - 3600
+    #l = mlines.Line2D([timestampLocal, timestampLocal], [rainYRange[0], rainScaleMax])
+    #rainAxis.add_line(l)
+    #rainAxis.plot([timestampLocal], [(rainScaleMax-rainYRange[0])/40], '^', color='blue', linewidth=2)
+    add(rainAxis.plot([timestampLocal], [rainScaleMax* 0.97], 'v', color='green', markersize=10)[0])
+
+
+    if progressCallback:
+        progressCallback("40%")
+    forecastMetrics.phase("temperature")
+
+    # Temperature
+    logging.debug("Creating temperature plot...")
+    add(temperatureAxis.plot(data["timestamps"], data["temperature"], label = "temperature", color=forecast.temperatureColor, linewidth=4)[0])
+
+
+    # Make sure the temperature scaling has a gap of 45 pixel, so we can fit the labels
+    interimPixelToTemperature = (np.nanmax(data["temperature"]) - np.nanmin(data["temperature"])) / height
+    extraYScaleGap = float(45) * interimPixelToTemperature
+    temperatureScaleMin = np.nanmin(data["temperature"]) - extraYScaleGap
+    temperatureScaleMax = np.nanmax(data["temperature"]) + extraYScaleGap
+
+
+    if measuredTemperature:
+        measTempTime, measTemperature = measuredTemperature
+        measTempTime = [t + forecast.utcOffset * 3600 for t in measTempTime]
+        temperatureScaleMin = min(temperatureScaleMin, min(measTemperature) - extraYScaleGap)
+        temperatureScaleMax = max(temperatureScaleMax, max(measTemperature) + extraYScaleGap)
+
+
+    temperatureAxis.set_ylim(temperatureScaleMin, temperatureScaleMax)
+    pixelToTemperature = (temperatureScaleMax - temperatureScaleMin) / height
+
+
+    # Temperature variance
+    add(temperatureVarianceAxis.fill_between(data["timestamps"], data["temperatureVarianceMin"], data["temperatureVarianceMax"], facecolor=forecast.temperatureColor, alpha=0.2))
+    temperatureVarianceAxis.set_ylim(temperatureScaleMin, temperatureScaleMax)
+
+
+    if measuredRain:
+        logging.debug("Measured rain data got provided, adding it to plot...")
+        #rainAxis.step(measRainTime, measRain, where='post', alpha=0.4, color='red') # Histogram curve
+        add(rainAxis.fill_between(measRainTime, measRain, alpha=0.8, step="post", zorder=2)) # Histogram infill
+
+    if measuredTemperature:
+        logging.debug("Measured temperature data got provided, adding it to plot...")
+        add(temperatureVarianceAxis.plot(measTempTime, measTemperature, linewidth=4, color='coral', zorder=2)[0])
+
+
+    logging.debug("Adding various additional information to the graph...")
+
+    if progressCallback:
+        progressCallback("60%")
+    forecastMetrics.phase("minMaxTemperature")
+
+    # Mark min/max temperature per day
+    if minMaxTemperature:
+        da = DrawingArea(2, 2, 0, 0)
+        da.add_artist(Circle((1, 1), 4, color=forecast.temperatureColor, fc="white", lw=2))
+        extremes = forecastData.getDailyMinMaxTemperatures(data, pixelScale=(xPixelsPerDay, temperatureScaleMin, temperatureScaleMax, height))
+        for day in range(0, data["noOfDays"]):
+            dayXPixelMin = day * xPixelsPerDay
+            dayXPixelMax = (day + 1) * xPixelsPerDay - 1
+
+            for extreme, labelOffset, labelAlignment in ((extremes["max"], 8, "bottom"), (extremes["min"], -12, "top")):
+                if np.isnan(extreme["temperature"][day]): # No data
+                    continue
+                if day < data["noOfDays"]-1 and extreme["xpixel"][day] == extreme["xpixel"][day+1]: # Prevent multiple circles/lables for same spot (00:00/24:00)
+                    continue
+                timestamp = float(extreme["timestamp"][day])
+                temperature = float(extreme["temperature"][day])
+                xpixel = float(extreme["xpixel"][day])
+                ypixel = float(extreme["ypixel"][day])
+
+                # Temperature Circles
+                add(temperatureVarianceAxis.add_artist(AnnotationBbox(da, (timestamp, temperature), xybox=(timestamp, temperature), xycoords='data', boxcoords=("data", "data"), frameon=False)))
+
+                # Temperature Labels
+                text = str(int(round(temperature, 0))) + "°C"
+                temporaryLabel = context.measureText(text, weight='bold')
+
+                # Check if text is fully within the day (x axis)
+                if xpixel - temporaryLabel.width / 2 < dayXPixelMin: # To far left
+                    xpixel = dayXPixelMin + temporaryLabel.width / 2 + forecast.textShadowWidth / 2
+                if xpixel + temporaryLabel.width / 2 > dayXPixelMax: # To far right
+                    xpixel = dayXPixelMax - temporaryLabel.width / 2 - forecast.textShadowWidth / 2
+
+                add(temperatureVarianceAxis.annotate(text, xycoords=('axes pixels'), xy=(xpixel, ypixel + labelOffset),
+                                                ha="center", va=labelAlignment, color=colors["temperature-label"], weight='bold', fontsize=context.fontSize,
+                                                path_effects=[path_effects.withStroke(linewidth=forecast.textShadowWidth, foreground="w")]))
+
+    if progressCallback:
+        progressCallback("80%")
+    forecastMetrics.phase("symbols")
+
+    # Print day names
+    for day in range(0, data["noOfDays"]):
+        context.dayNameLabels[day].set_text(data['dayNames'][day])
+
+
+    # Show Symbols above the graph
+    symbolScale = symbolZoom / 1.41 * 0.15 * fig.dpi / 72 # The symbols get resampled once to the size they are drawn with
+    for i in range(0, len(data["symbols"]), symbolDivision):
+        symbolImage = _symbolCache.get(data["symbols"][i], symbolScale)
+        if symbolImage is None:
+            continue
+        imagebox = OffsetImage(symbolImage, zoom=1, dpi_cor=False)
+        xyPos = ((data["symbolsTimestamps"][i] - data["symbolsTimestamps"][0]) / (24*3600) + len(data["symbols"])/24/6/data["noOfDays"]) * xPixelsPerDay, height + 22
+        ab = AnnotationBbox(imagebox, xy=xyPos, xycoords='axes pixels', frameon=False)
+        add(rainAxis.add_artist(ab))
+
+    if progressCallback:
+        progressCallback("90%")
+    forecastMetrics.phase("draw")
+
+    # Render the graph once, the pixels then get encoded as needed
+    fig.patch.set_facecolor(colors["background"])
+    fig.canvas.draw()
+    pixels = np.asarray(fig.canvas.buffer_rgba()) # only valid until the next render with this context
+    image = None
+    if outputFilename or returnImage == "bytes":
+        forecastMetrics.phase("encode", imageFormat=imageEncoder.parseImageFormat(imageFormat)[0])
+        encoded = imageEncoder.encodeImage(pixels, imageFormat)
+        forecastMetrics.annotate(bytes=len(encoded))
+        if outputFilename:
+            logging.debug("Saving graph to %s" % outputFilename)
+            forecastMetrics.phase("write")
+            imageEncoder.writeImageFile(outputFilename, encoded)
+        if returnImage == "bytes":
+            image = encoded
+    if returnImage == "array":
+        image = pixels.copy()
+    elif returnImage == "image":
+        image = Image.fromarray(pixels.copy(), 'RGBA')
+    if not renderContext:
+        context.close()
+
+    # Meta Data
+    forecastMetrics.phase("metaData")
+    metaData = {}
+    metaData['city'] = forecast.cityName
+    metaData['imageHeight'] = graphHeight
+    metaData['imageWidth'] = graphWidth
+    metaData['firstDayX'] = context.firstDayX
+    metaData['firstDayY'] = context.firstDayY
+    metaData['dayWidth'] = context.dayWidth
+    metaData['dayHeight'] = context.dayHeight
+    metaData['modelTimestamp'] = forecast.data["modelCalculationTimestamp"] # Seconds in UTC
+    metaData['firstDayTimestamp'] = int(data["timestamps"][0] - forecast.utcOffset * 3600) # Seconds in UTC, start of the first day shown
+    metaData['noOfDays'] = data["noOfDays"]
+    metaData['contentFingerprint'] = fingerprint
+    metaData['forecastGenerationTimestamp'] = int(datetime.datetime.now().timestamp())
+    if writeMetaData:
+        logging.debug("Saving Meta Data to %s" % writeMetaData)
+        with open(writeMetaData, 'w') as metaFile:
+            json.dump(metaData, metaFile)
+
+    if progressCallback:
+        progressCallback("100%")
+
+    if returnImage:
+        return metaData, image
+    return metaData
+
+
+"""
+Returns a fingerprint (hex string) of everything the graph shows: the forecast data, the render options and the
+time of the model run (only if its marker is within the shown days). A new forecast run with the same values for the
+shown days results in the same fingerprint.
+"""
+def getContentFingerprint(forecast, data, renderOptions):
+    content = dict(data)
+    # The model run gets marked at its local time, which is often before the first day shown
+    modelTimestampLocal = data["modelCalculationTimestamp"] + forecast.utcOffset * 3600 - 3600
+    if not data["timestamps"][0] <= modelTimestampLocal <= data["timestamps"][0] + data["noOfDays"] * 24 * 3600:
+        content["modelCalculationTimestamp"] = None
+    colors = forecast.colorsDarkMode if renderOptions.get('darkMode') else forecast.colorsLightMode
+    fingerprint = [fingerprintVersion, content, renderOptions, forecast.cityName, forecast.utcOffset, colors]
+    return hashlib.sha1(json.dumps(fingerprint, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+# Returns the meta data of the existing graph if it has the given fingerprint, otherwise None
+def _getUnchangedMetaData(forecast, outputFilename, metaFileName, fingerprint):
+    try:
+        with open(metaFileName) as f:
+            metaData = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if metaData.get('contentFingerprint') != fingerprint or not os.path.isfile(outputFilename):
+        return None
+
+    # The graph stays the same, only the meta data needs to tell about the new forecast run
+    if metaData.get('modelTimestamp') != forecast.data["modelCalculationTimestamp"]:
+        metaData['modelTimestamp'] = forecast.data["modelCalculationTimestamp"]
+        logging.debug("Saving Meta Data to %s" % metaFileName)
+        with open(metaFileName, 'w') as metaFile:
+            json.dump(metaData, metaFile)
+    return metaData
+
+
+# Reads an existing graph as generateGraph() returns it, see returnImage
+def _readImage(fileName, metaData, imageFormat, returnImage):
+    with open(fileName, 'rb') as f:
+        content = f.read()
+    if returnImage == "bytes":
+        return content
+    if imageEncoder.parseImageFormat(imageFormat)[0] == 'rgba':
+        pixels = np.frombuffer(content, dtype=np.uint8).reshape(metaData['imageHeight'], metaData['imageWidth'], 4)
+        image = Image.fromarray(pixels.copy(), 'RGBA')
+    else:
+        with Image.open(io.BytesIO(content)) as im:
+            image = im.convert('RGBA')
+    if returnImage == "array":
+        return np.asarray(image).copy()
+    return image
+
+
+"""
+Returns the rain as stacked bars, one segment per color band of rainColorSteps, or None if there is no rain.
+All segments get built as one vertex array, ordered by color band and time.
+"""
+def getRainBars(forecast, timestamps, rainfall):
+    steps = np.array(forecast.rainColorSteps, dtype=float)
+    stepSizes = np.array(forecast.rainColorStepSizes, dtype=float)
+    rain = np.array(rainfall, dtype=float)
+
+    # hours x bands: the part of the rain in each band, each band starts at the end of the previous one
+    heights = np.clip(rain[:, None] - (steps - stepSizes)[None, :], 0, stepSizes[None, :])
+    bottoms = np.zeros_like(heights)
+    np.cumsum(heights[:, :-1], axis=1, out=bottoms[:, 1:])
+
+    heights, bottoms = heights.T, bottoms.T
+    segments = heights > 0 # NaN (missing data) is never > 0
+    if not segments.any():
+        return None
+    bands, hours = np.nonzero(segments)
+    x = np.array(timestamps, dtype=float)[hours]
+    y = bottoms[segments]
+    h = heights[segments]
+    vertices = np.stack([np.stack([x, y], axis=1), np.stack([x + 3000, y], axis=1),
+                         np.stack([x + 3000, y + h], axis=1), np.stack([x, y + h], axis=1)], axis=1)
+    # Transparent edges instead of 'none', the bars get snapped to the pixels as stroked shapes
+    return PolyCollection(vertices, facecolors=np.array(forecast.rainColors)[bands], edgecolors=(0, 0, 0, 0), zorder=3)
+
+
+"""
+Builds the static parts of the graph (figure, axes, ticks, labels) into the render context
+"""
+def _buildGraphScaffold(forecast, context, layout, colors):
+    graphWidth, graphHeight, darkMode, fontSize, noOfDays, rainVariance, showCityName, hideDataCopyright, cityName = layout
+    logging.debug("Building the graph layout...")
+
+    # No pyplot, the figure must not depend on global state so that graphs can be rendered in parallel threads
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    rainAxis = fig.add_subplot(111)
+
+    # set font sizes, every text gets its size explicitly instead of using rcParams['font.size']
+    context.fontSize = fontSize
+    rainAxis.tick_params(axis='y', labelsize=fontSize) # Rain Y axis
+    rainAxis.tick_params(axis='x', labelsize=fontSize) # Time axis
+
+    fig.set_size_inches(float(graphWidth)/fig.get_dpi(), float(graphHeight)/fig.get_dpi())
+
+
+    # Plot dimension and borders
+    bbox = rainAxis.get_window_extent().transformed(fig.dpi_scale_trans.inverted())
+    width, height = bbox.width * fig.dpi, bbox.height * fig.dpi # plot size in pixel
+
+    rainAxis.margins(x=0)
+
+    fig.subplots_adjust(left=40/width, right=1-40/width, top=1-35/height, bottom=40/height)
+
+    bbox = rainAxis.get_window_extent().transformed(fig.dpi_scale_trans.inverted())
+    width, height = bbox.width * fig.dpi, bbox.height * fig.dpi # plot size in pixel
+    context.width, context.height = width, height
+    context.xPixelsPerDay = width / noOfDays
+
+    # Dimensions of the axis in pixel
+    context.firstDayX = math.ceil(bbox.x0 * fig.dpi)
+    context.firstDayY = math.ceil(bbox.y0 * fig.dpi)
+    context.dayWidth = math.floor((bbox.x1 - bbox.x0) * fig.dpi) / noOfDays
+    context.dayHeight = math.floor((bbox.y1 - bbox.y0) * fig.dpi)
+
+    rainAxis.tick_params(axis='x', colors=colors["x-axis"])
+    rainAxis.tick_params(axis='y', labelcolor=colors["rain-axis"], width=0, length=8)
+    rainAxis.locator_params(axis='y', nbins=7)
+    # TODO find a better way than rounding
+    rainAxis.yaxis.set_major_formatter(FormatStrFormatter('%0.1f'))
+
+    if rainVariance:
+        context.rainfallVarianceAxis = rainAxis.twinx()  # instantiate a second axes that shares the same x-axis
+        context.rainfallVarianceAxis.axes.yaxis.set_visible(False)
+
+    temperatureAxis = rainAxis.twinx()  # instantiate a second axes that shares the same x-axis
+    #temperatureAxis.set_ylabel('Temperature', color=forecast.temperatureColor)
+    temperatureAxis.tick_params(axis='y', labelcolor=colors["temperature-axis"], labelsize=fontSize)
+    temperatureAxis.grid(True)
+
+    # Position the Y Scales
+    temperatureAxis.yaxis.tick_left()
+    rainAxis.yaxis.tick_right()
+
+    temperatureAxis.locator_params(axis='y', nbins=6)
+    temperatureAxis.yaxis.set_major_formatter(FormatStrFormatter('%0.1f'))
+
+    # Temperature variance
+    temperatureVarianceAxis = temperatureAxis.twinx()  # instantiate a second axes that shares the same x-axis
+    temperatureVarianceAxis.axes.yaxis.set_visible(False)
+    temperatureVarianceAxis.tick_params(axis='y', labelcolor=forecast.temperatureColor)
+
+    # Day names, the texts get set on each render
+    xPixelsPerDay = context.xPixelsPerDay
+    context.dayNameLabels = [rainAxis.annotate("", xy=(day * xPixelsPerDay + xPixelsPerDay / 2, -45), xycoords='axes pixels', ha="center", weight='bold', color=colors["x-axis"], fontsize=fontSize) for day in range(0, noOfDays)]
+
+    # Show y-axis units
+    rainAxis.annotate("mm\n/h", linespacing = 0.8, xy=(width + 25, height + 12), xycoords='axes pixels', ha="center", color=colors["rain-axis"], fontsize=fontSize)
+    rainAxis.annotate("°C", xy=(-20, height + 10), xycoords='axes pixels', ha="center", color=colors["temperature-axis"], fontsize=fontSize)
+
+    # The texts inside the plot area must be drawn above the data, which gets added later
+    textZOrder = 3.5
+
+    # Show city name in graph
+    if showCityName:
+        logging.debug("Adding city name to plot...")
+        text = rainAxis.annotate(cityName, xy=(width - 5, height - 18), color='gray', ha='right', linespacing = 0.8, xycoords='axes pixels', zorder=textZOrder, fontsize=fontSize)
+        text.set_path_effects([path_effects.Stroke(linewidth=forecast.textShadowWidth, foreground='white'), path_effects.Normal()])
+
+    # Show data copyright graph
+    if not hideDataCopyright:
+        logging.debug("Adding data copyright to plot...")
+        text = rainAxis.annotate("Data © by Meteoswiss", xy=(width - 5, 5), color='gray', ha='right', linespacing = 0.8, xycoords='axes pixels', zorder=textZOrder, fontsize=fontSize)
+        text.set_path_effects([path_effects.Stroke(linewidth=forecast.textShadowWidth, foreground='white'), path_effects.Normal()])
+
+    context.fig = fig
+    context.rainAxis = rainAxis
+    context.temperatureAxis = temperatureAxis
+    context.temperatureVarianceAxis = temperatureVarianceAxis
+    context.layout = layout
+
+
+"""
+Keeps the figure of a graph layout (size, colors, font, number of days, ...) between renders.
+Only the data dependent artists get replaced when generateGraph() renders the same layout again.
+"""
+class GraphRenderContext:
+
+    def __init__(self):
+        self.layout = None
+        self.fig = None
+        self.fontSize = None
+        self.dataArtists = []
+
+
+    # Registers a data dependent artist, it gets removed before the next render
+    def add(self, artist):
+        self.dataArtists.append(artist)
+        return artist
+
+
+    def clear(self):
+        for artist in self.dataArtists:
+            artist.remove()
+        self.dataArtists = []
+
+
+    # Returns the extent (in pixel) of a text in the font size of the layout, every text gets measured once per process
+    def measureText(self, text, weight='normal'):
+        key = (text, self.fontSize, weight, self.fig.dpi)
+        extent = _textExtents.get(key)
+        if extent is None:
+            t = self.fig.text(0, 0, text, fontsize=self.fontSize, weight=weight)
+            extent = t.get_window_extent(renderer=self.fig.canvas.get_renderer())
+            t.remove()
+            _textExtents[key] = extent
+        return extent
+
+
+    def close(self):
+        self.layout = None
+        self.fig = None
+        self.dataArtists = []
+
+
+# Render context of the worker process, kept between the renders of renderVariants()
+_workerRenderContext = None
+
+
+def _renderVariant(forecast, data, renderSpec):
+    global _workerRenderContext
+    if _workerRenderContext is None:
+        _workerRenderContext = GraphRenderContext()
+    renderSpec = dict(renderSpec)
+    daysToUse = renderSpec.pop('daysToUse', None)
+    if daysToUse:
+        data = forecastData.limitDataToDays(data, daysToUse)
+    metaData = forecast.generateGraph(data=data, renderContext=_workerRenderContext, **renderSpec)
+    return renderSpec['outputFilename'], metaData
+
+
+# Sets up a worker process of createRenderPool() like the process that created the pool
+def _initRenderWorker(atlasDirectory):
+    if _symbolCache.atlasDirectory != atlasDirectory:
+        setSymbolAtlasDirectory(atlasDirectory)
+
+
+"""
+Creates a process pool for renderVariants().
+Its workers use the symbol atlas directory of this process, also if they get started with "spawn" or "forkserver" instead of being forked.
+"""
+def createRenderPool(processes=None):
+    return concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=_initRenderWorker, initargs=(_symbolCache.atlasDirectory,))
+
+
+"""
+Renders several graphs of the same forecast data in a process pool.
+renderSpecs: List of generateGraph() keyword arguments, every spec needs its own outputFilename.
+             An optional "daysToUse" shows less days than the data got collected for, see limitDataToDays().
+executor: Optional process pool from createRenderPool() to use, eg. to share it between several locations. Otherwise a pool with the given number of processes gets created.
+Returns the list of (output file name, meta data) in the order of the specs.
+"""
+def renderVariants(forecast, data, renderSpecs, processes=None, executor=None):
+    if not renderSpecs:
+        return []
+    if executor is None:
+        with createRenderPool(processes) as executor:
+            return renderVariants(forecast, data, renderSpecs, executor=executor)
+
+    with forecastMetrics.span("renderVariants", variants=len(renderSpecs)):
+        futures = [executor.submit(_renderVariant, forecast, data, renderSpec) for renderSpec in renderSpecs]
+        return [future.result() for future in futures]
@@ -0,0 +1,309 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+
+"""
+Timing of the stages (STAC discovery, metadata lookup, downloads, data collection, render phases, encoding, ...).
+The code marks its stages with span() and adds details with annotate(), eg. the size of a download.
+The recorded spans get handed to the sinks with flush(), eg. once per update of the graphs:
+ - log: one log line per span, indented by its nesting
+ - json:<file>: appends one JSON line per flush with all spans
+ - prometheus:<file>: writes a textfile for the textfile collector of the Prometheus node exporter
+Without any sink nothing gets recorded.
+The open spans are kept in a context variable, so asyncio tasks and functions run via asyncio.to_thread() nest in the span they got started from.
+"""
+
+_sinks = []
+_spans = [] # finished spans since the last flush
+_spansLock = threading.Lock()
+_stack = contextvars.ContextVar('forecastMetricsStack', default=()) # tuple of the open spans of the context
+
+
+class Span:
+
+    def __init__(self, name, parent, isPhase=False, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.isPhase = isPhase
+        self.depth = parent.depth + 1 if parent else 0
+        self.attributes = dict(attributes) if attributes else {}
+        self.start = time.time()
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+
+    def finish(self):
+        record = {
+            'name': self.name,
+            'parent': self.parent.name if self.parent else None,
+            'depth': self.depth,
+            'start': self.start,
+            'duration': time.perf_counter() - self.wall,
+            'cpu': time.thread_time() - self.cpu, # of this thread only
+        }
+        record.update(self.attributes)
+        with _spansLock:
+            _spans.append(record)
+
+
+# Finishes the open spans of the context down to (and including) the given span
+def _finishUntil(span):
+    stack = list(_stack.get())
+    while stack:
+        top = stack.pop()
+        top.finish()
+        if top is span:
+            break
+    _stack.set(tuple(stack))
+
+
+def isEnabled():
+    return bool(_sinks)
+
+
+def addSink(sink):
+    _sinks.append(sink)
+
+
+def removeSinks():
+    del _sinks[:]
+
+
+"""
+Context manager timing a stage, spans opened within it (in the same thread or asyncio task) are nested in it.
+If the block raises an exception, it gets added as "error" attribute.
+"""
+@contextlib.contextmanager
+def span(name, **attributes):
+    if not _sinks:
+        yield
+        return
+    stack = _stack.get()
+    current = Span(name, stack[-1] if stack else None, attributes=attributes)
+    _stack.set(stack + (current,))
+    try:
+        yield
+    except BaseException as e:
+        current.attributes['error'] = type(e).__name__
+        raise
+    finally:
+        _finishUntil(current)
+
+
+# Decorator timing every call of the function as span of the given name
+def timed(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+"""
+Returns the function wrapped so that its spans get nested in the current span, even if it runs in another thread,
+eg. when it gets submitted to a thread pool.
+"""
+def inCurrentSpan(function):
+    if not _sinks:
+        return function
+    parents = _stack.get()[-1:]
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _stack.set(parents)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _stack.reset(token)
+    return wrapper
+
+
+"""
+Starts the next phase of the current span: the previous phase ends, the new one is named "<span>.<phase>".
+All phases end with their span, so a function only needs to mark where a phase starts.
+"""
+def phase(name, **attributes):
+    if not _sinks:
+        return
+    stack = _stack.get()
+    if stack and stack[-1].isPhase:
+        stack[-1].finish()
+        stack = stack[:-1]
+    parent = stack[-1] if stack else None
+    _stack.set(stack + (Span("%s.%s" % (parent.name, name) if parent else name, parent, isPhase=True, attributes=attributes),))
+
+
+# Adds attributes (eg. bytes=1234, cache="hit") to the innermost open span of the context
+def annotate(**attributes):
+    if not _sinks:
+        return
+    stack = _stack.get()
+    if stack:
+        stack[-1].attributes.update(attributes)
+
+
+"""
+Hands the spans finished since the last flush to all sinks and returns them.
+A failing sink gets logged, it does not stop the others.
+"""
+def flush():
+    with _spansLock:
+        spans = sorted(_spans, key=lambda record: record['start'])
+        del _spans[:]
+    if not spans:
+        return spans
+    for sink in _sinks:
+        try:
+            sink.write(spans)
+        except Exception as e:
+            logging.warning("Failed to write the metrics to %s: %s" % (sink, e))
+    return spans
+
+
+# Returns the permissions of the existing file, or the ones a new file gets with the current umask
+def _getFileMode(fileName):
+    try:
+        return os.stat(fileName).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+"""
+Writes a file via a temporary file, so readers (eg. the node exporter) never see a partially written file.
+The file keeps its permissions, a new one gets them like from open() instead of the 0600 of the temporary file.
+"""
+def _writeAtomic(fileName, content):
+    directory = os.path.dirname(os.path.abspath(fileName))
+    mode = _getFileMode(fileName)
+    handle, tempName = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(handle, 'w') as f:
+            f.write(content)
+        os.chmod(tempName, mode)
+        os.replace(tempName, fileName)
+    except BaseException:
+        try:
+            os.remove(tempName)
+        except OSError:
+            pass
+        raise
+
+
+# Returns the attributes of a span (everything but the fields every span has)
+def _getAttributes(record):
+    return {key: value for key, value in record.items() if key not in ('name', 'parent', 'depth', 'start', 'duration', 'cpu')}
+
+
+class LogSink:
+
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+
+    def write(self, spans):
+        for record in spans:
+            attributes = " ".join("%s=%s" % (key, value) for key, value in sorted(_getAttributes(record).items()))
+            logging.log(self.level, "Timing: %s%s %.1f ms (cpu %.1f ms)%s" % ("  " * record['depth'], record['name'], record['duration'] * 1000, record['cpu'] * 1000, " " + attributes if attributes else ""))
+
+
+    def __str__(self):
+        return "log"
+
+
+# Appends one line per flush: {"timestamp": ..., "spans": [...]}
+class JsonFileSink:
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+
+
+    def write(self, spans):
+        with open(self.fileName, 'a') as f:
+            f.write(json.dumps({'timestamp': time.time(), 'spans': spans}) + "\n")
+
+
+    def __str__(self):
+        return self.fileName
+
+
+"""
+Writes the spans of the last flush as gauges, the file gets replaced on every flush:
+ <prefix>_stage_duration_seconds, <prefix>_stage_cpu_seconds and <prefix>_stage_count per stage,
+ numeric attributes as <prefix>_stage_<attribute> (eg. <prefix>_stage_bytes), text attributes become labels.
+Spans with the same name and labels get summed up (eg. the collectData() calls of several locations).
+"""
+class PrometheusTextfileSink:
+
+    def __init__(self, fileName, prefix="meteoswiss_forecast"):
+        self.fileName = fileName
+        self.prefix = prefix
+
+
+    def write(self, spans):
+        metrics = {} # metric name -> {labels -> value}
+        for record in spans:
+            attributes = _getAttributes(record)
+            labels = [('stage', record['name'])]
+            values = {'duration_seconds': record['duration'], 'cpu_seconds': record['cpu'], 'count': 1}
+            for key, value in sorted(attributes.items()):
+                if isinstance(value, (bool, int, float)):
+                    values[_toSnakeCase(key)] = float(value)
+                elif value is not None:
+                    labels.append((_toSnakeCase(key), str(value)))
+            labels = tuple(labels)
+            for name, value in values.items():
+                series = metrics.setdefault("%s_stage_%s" % (self.prefix, name), {})
+                series[labels] = series.get(labels, 0) + value
+
+        lines = []
+        for name, series in sorted(metrics.items()):
+            lines.append("# TYPE %s gauge" % name)
+            for labels, value in sorted(series.items()):
+                lines.append("%s{%s} %r" % (name, ",".join('%s="%s"' % (key, _escapeLabel(value)) for key, value in labels), value))
+        lines.append("# TYPE %s_last_flush_timestamp_seconds gauge" % self.prefix)
+        lines.append("%s_last_flush_timestamp_seconds %d" % (self.prefix, time.time()))
+        _writeAtomic(self.fileName, "\n".join(lines) + "\n")
+
+
+    def __str__(self):
+        return self.fileName
+
+
+def _toSnakeCase(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', name)).lower()
+
+
+def _escapeLabel(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+"""
+Creates a sink from its description: "log", "log:debug", "json:<file>" or "prometheus:<file>".
+Raises an exception if the description is invalid.
+"""
+def createSink(description):
+    name, _, argument = description.partition(':')
+    name = name.strip().lower()
+    if name == 'log':
+        level = logging.getLevelName(argument.upper()) if argument else logging.INFO
+        if not isinstance(level, int):
+            raise Exception("Unknown log level %r" % argument)
+        return LogSink(level)
+    if name in ('json', 'prometheus'):
+        if not argument:
+            raise Exception("The metrics sink %s needs a file name, eg. %s:/tmp/metrics" % (name, name))
+        return JsonFileSink(argument) if name == 'json' else PrometheusTextfileSink(argument)
+    raise Exception("Unknown metrics sink %r, use log, json:<file> or prometheus:<file>" % description)
@@ -0,0 +1,275 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import argparse
+import collections
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import meteoswissForecast
+import forecastGraph
+import imageEncoder
+
+
+"""
+Query parameters of the forecast requests, they have the same names and defaults as the options of meteoswissForecast.py.
+name -> (type, default, keyword argument of collectData()/generateGraph())
+"""
+queryOptions = {
+    'days-to-show': (int, 4, 'daysToUse'),
+    'height': (int, None, 'graphHeight'),
+    'width': (int, 1920, 'graphWidth'),
+    'time-divisions': (int, 6, 'timeDivisions'),
+    'dark-mode': (bool, False, 'darkMode'),
+    'font-size': (int, 12, 'fontSize'),
+    'min-max-temperatures': (bool, False, 'minMaxTemperature'),
+    'rain-variance': (bool, False, 'rainVariance'),
+    'locale': (str, "en_US.utf8", 'localeAlias'),
+    'date-format': (str, "%A, %-d. %B", 'dateFormat'),
+    'time-format': (str, "%H:%M", 'timeFormat'),
+    'symbol-zoom': (float, 1.0, 'symbolZoom'),
+    'symbol-divisions': (int, 1, 'symbolDivision'),
+    'city-name': (bool, False, 'showCityName'),
+    'hide-data-copyright': (bool, False, 'hideDataCopyright'),
+    'show-sunshine': (bool, False, 'showSunshine'),
+    'sunshine-bars': (bool, False, 'sunshineBars'),
+    'image-format': (str, None, 'imageFormat'),
+}
+
+# Options which need a finite value greater than 0 (if given)
+positiveOptions = ['height', 'width', 'time-divisions', 'font-size', 'symbol-zoom', 'symbol-divisions']
+
+# Options which are used by collectData(), all others are passed to generateGraph()
+collectDataOptions = ['daysToUse', 'timeFormat', 'dateFormat', 'localeAlias', 'showSunshine', 'rainVariance']
+
+
+# Parses the query string to a sorted tuple of (keyword argument, value), raises a ValueError on invalid options
+def parseOptions(query):
+    values = parse_qs(query, keep_blank_values=True)
+    options = {}
+    for name, value in values.items():
+        if name not in queryOptions:
+            raise ValueError("Unknown option %r" % name)
+        optionType, default, keyword = queryOptions[name]
+        value = value[-1]
+        if optionType == bool:
+            options[keyword] = value.lower() not in ("0", "false", "no")
+        else:
+            options[keyword] = optionType(value)
+    for name, (optionType, default, keyword) in queryOptions.items():
+        options.setdefault(keyword, default)
+
+    if not 1 <= options['daysToUse'] <= meteoswissForecast.maximumNumberOfDays:
+        raise ValueError("days-to-show must be between 1 and %d" % meteoswissForecast.maximumNumberOfDays)
+    for name in positiveOptions:
+        value = options[queryOptions[name][2]]
+        if value is not None and (not math.isfinite(value) or value <= 0):
+            raise ValueError("%s must be a finite number greater than 0" % name)
+    try:
+        imageEncoder.parseImageFormat(options['imageFormat'])
+    except Exception as e:
+        raise ValueError(str(e))
+    # Same as the command line flag, which sets it to False when given
+    options['hideDataCopyright'] = not options['hideDataCopyright']
+    return tuple(sorted(options.items()))
+
+
+"""
+Keeps the forecast objects of the requested locations and the rendered graphs in memory.
+A graph only gets rendered again once a new forecast run got published.
+At most maxGraphs graphs are kept, the least recently requested ones get dropped first.
+"""
+class ForecastRenderer:
+
+    def __init__(self, utcOffset=None, runCheckInterval=60, renderThreads=None, maxGraphs=500):
+        self.utcOffset = utcOffset # None: use the current offset of Europe/Zurich
+        self.runCheckInterval = runCheckInterval # seconds between checks for a new forecast run
+        self.forecasts = {}
+        self.graphs = collections.OrderedDict() # (zip code, run, UTC offset, options) -> (image, meta data), least recently used first
+        self.maxGraphs = maxGraphs
+        self.latestRun = None
+        self.currentUtcOffset = utcOffset
+        self.lastRunCheck = 0
+        self.lock = threading.Lock()
+        self.collectLock = threading.Lock() # collectData() uses global state (locale) and the data of the forecast object
+        self.renderSlots = threading.BoundedSemaphore(renderThreads if renderThreads else (os.cpu_count() or 1)) # graphs get rendered in parallel
+        self.renderContexts = [] # idle render contexts, every running render uses its own
+        self.keyLocks = {} # key -> lock held while the graph gets rendered, so it only gets rendered once
+
+
+    def getLatestRun(self):
+        with self.lock:
+            if self.latestRun is None or time.time() - self.lastRunCheck > self.runCheckInterval:
+                index = meteoswissForecast.getStacIndex()
+                run = index.getLatestCompleteRun()
+                if run is None:
+                    raise Exception("No forecast run with all required parameters found")
+                if run != self.latestRun:
+                    logging.info("New forecast run: %s" % run)
+                    self.graphs = collections.OrderedDict((key, graph) for key, graph in self.graphs.items() if key[1] == run)
+                    self.latestRun = run
+                if self.utcOffset is None:
+                    self.currentUtcOffset = meteoswissForecast.getCurrentUtcOffset()
+                self.lastRunCheck = time.time()
+            return self.latestRun, self.currentUtcOffset
+
+
+    def getForecast(self, zipCode, utcOffset):
+        with self.lock:
+            forecast = self.forecasts.get(zipCode)
+        if forecast is None:
+            forecast = meteoswissForecast.MeteoSwissForecast(zipCode=zipCode, utcOffset=utcOffset)
+            with self.lock:
+                self.forecasts[zipCode] = forecast
+        return forecast
+
+
+    """
+    Returns the graph (encoded in the requested image format) and its meta data (JSON data) of the zip code.
+    """
+    def getGraph(self, zipCode, options):
+        run, utcOffset = self.getLatestRun()
+        key = (zipCode, run, utcOffset, options)
+        with self.lock:
+            if key in self.graphs:
+                self.graphs.move_to_end(key)
+                return self.graphs[key]
+            keyLock = self.keyLocks.setdefault(key, threading.Lock())
+
+        forecast = self.getForecast(zipCode, utcOffset)
+        kwargs = dict(options)
+        collectArgs = {name: kwargs.pop(name) for name in collectDataOptions}
+        try:
+            with keyLock:
+                with self.lock:
+                    if key in self.graphs: # got rendered while waiting
+                        return self.graphs[key]
+                with self.collectLock:
+                    forecast.utcOffset = utcOffset
+                    # collectData() returns the data dict of the forecast object, the next call replaces its values
+                    data = dict(forecast.collectData(forecastDataUrl=run, **collectArgs))
+                with self.renderSlots:
+                    graph = self.render(forecast, data, rainVariance=collectArgs['rainVariance'], showSunshine=collectArgs['showSunshine'], **kwargs)
+
+                with self.lock:
+                    if run == self.latestRun:
+                        self.graphs[key] = graph
+                        while len(self.graphs) > self.maxGraphs:
+                            self.graphs.popitem(last=False)
+        finally:
+            with self.lock:
+                self.keyLocks.pop(key, None) # also if the graph failed, a further request tries again
+        return graph
+
+
+    def render(self, forecast, data, **kwargs):
+        with self.lock:
+            renderContext = self.renderContexts.pop() if self.renderContexts else forecastGraph.GraphRenderContext()
+        try:
+            metaData, image = forecast.generateGraph(data=data, renderContext=renderContext, returnImage="bytes", **kwargs)
+        finally:
+            with self.lock:
+                self.renderContexts.append(renderContext)
+        return image, json.dumps(metaData).encode('utf-8')
+
+
+class ForecastRequestHandler(BaseHTTPRequestHandler):
+    renderer = None
+    pathPattern = re.compile(r'^/forecast/(\d+)(\.png|/meta\.json)$')
+
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        m = self.pathPattern.match(url.path)
+        if not m:
+            self.sendError(404, "Unknown path, use /forecast/<zip code>.png or /forecast/<zip code>/meta.json")
+            return
+        try:
+            options = parseOptions(url.query)
+        except ValueError as e:
+            self.sendError(400, str(e))
+            return
+
+        try:
+            image, meta = self.renderer.getGraph(int(m.group(1)), options)
+        except Exception as e:
+            if "Unknown zip code" in str(e):
+                self.sendError(404, str(e))
+            else:
+                logging.error("Failed to render the forecast of %s: %s" % (m.group(1), e))
+                self.sendError(500, str(e))
+            return
+
+        if m.group(2) == ".png":
+            self.sendContent(image, imageEncoder.getContentType(dict(options)['imageFormat']))
+        else:
+            self.sendContent(meta, "application/json")
+
+
+    def sendContent(self, content, contentType):
+        etag = '"%s"' % hashlib.sha1(content).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+    def sendError(self, code, message):
+        content = message.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', "text/plain; charset=utf-8")
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s" % (self.address_string(), format % args))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Server rendering the MeteoSwiss forecast graphs on request, eg. http://localhost:8080/forecast/8001.png?days-to-show=3&dark-mode=1')
+    parser.add_argument('-v', action='store_true', help='Verbose output')
+    parser.add_argument('--host', action='store', help='Address to listen on', default="127.0.0.1")
+    parser.add_argument('--port', action='store', type=int, help='Port to listen on', default=8080)
+    parser.add_argument('--utc-offset', action='store', type=int, help='Offset to UTC, only needed if system does not know it (eg in a docker container)', default=None)
+    parser.add_argument('--render-threads', action='store', type=int, help='Maximum number of graphs rendered in parallel, default is the number of CPUs', default=None)
+    parser.add_argument('--max-graphs', action='store', type=int, help='Maximum number of rendered graphs kept in memory, the least recently requested ones get dropped first', default=500)
+    parser.add_argument('--run-check-interval', action='store', type=int, help='Seconds between checks for a new forecast run', default=60)
+    parser.add_argument('--cache-dir', action='store', help='Directory used to cache the downloaded data', default=meteoswissForecast.defaultCacheDirectory)
+    parser.add_argument('--no-cache', action='store_true', help='Do not cache the downloaded data on disk')
+    parser.add_argument('--stac-url', action='store', help='URL of the STAC collection, eg. of a local stub server', default=meteoswissForecast.MeteoSwissForecast.stacCollectionUrl)
+    parser.add_argument('--point-meta-url', action='store', help='URL of the point metadata CSV, eg. of a local stub server', default=meteoswissForecast.MeteoSwissForecast.pointMetaUrl)
+
+    args = parser.parse_args()
+
+    logLevel = logging.INFO
+    if args.v:
+        logLevel = logging.DEBUG
+
+    logging.basicConfig(format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%d-%b-%y %H:%M:%S', level=logLevel)
+    logging.getLogger("matplotlib").setLevel(logging.WARNING) # hiding the debug messages from the matplotlib
+    logging.getLogger("PIL").setLevel(logging.WARNING) # hiding the debug messages from the PIL
+
+    meteoswissForecast.setCacheDirectory(None if args.no_cache else args.cache_dir)
+    meteoswissForecast.MeteoSwissForecast.stacCollectionUrl = args.stac_url
+    meteoswissForecast.MeteoSwissForecast.pointMetaUrl = args.point_meta_url
+
+    ForecastRequestHandler.renderer = ForecastRenderer(utcOffset=args.utc_offset, runCheckInterval=args.run_check_interval, renderThreads=args.render_threads, maxGraphs=args.max_graphs)
+    server = ThreadingHTTPServer((args.host, args.port), ForecastRequestHandler)
+    logging.info("Serving forecasts on http://%s:%d/forecast/<zip code>.png" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,183 @@
+import array
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+
+
+runPattern = re.compile(r'\.(\d{12})\.\w+\.csv$')
+
+# Marks missing values in the integer tables (float tables use NaN)
+missingInt = -32768
+
+
+"""
+Columnar table of one parameter of one forecast run.
+The values are a (points x dates) array, memory-mapped from disk so that processes share the pages.
+"""
+class ParameterTable:
+
+    def __init__(self, dates, points, values):
+        self.dates = dates
+        self.index = {(pointId, pointType): row for row, (pointId, pointType) in enumerate(points)}
+        self.values = values
+        self.isFloat = values.dtype.kind == 'f'
+
+
+    """
+    Returns the series (date -> value) of a point, or an empty dict if the point is not part of the table.
+    """
+    def getSeries(self, pointId, pointType):
+        row = self.index.get((pointId, pointType))
+        if row is None:
+            return {}
+        if self.isFloat:
+            # float32 is not exact, the CSVs contain at most two decimals
+            values = np.round(self.values[row].astype(np.float64), 3).tolist()
+            return {date: (None if value != value else value) for date, value in zip(self.dates, values)}
+        values = self.values[row].tolist()
+        return {date: (None if value == missingInt else value) for date, value in zip(self.dates, values)}
+
+
+"""
+Converts the parameter CSVs of a forecast run into columnar tables on disk:
+<directory>/<run>/<parameter>.npy holds the values, <parameter>.json the dates and the point index.
+Tables are built once per run and parameter, later lookups are a slice of the memory-mapped array.
+Only the tables of the run opened last are kept open, so a long running process does not keep the maps of old runs.
+"""
+class ForecastStore:
+
+    def __init__(self, directory, openStream, maxAge=2 * 24 * 3600):
+        self.directory = directory
+        self.openStream = openStream # function returning a binary stream of an URL
+        self.maxAge = maxAge # seconds a run is kept
+        self.tables = {} # (run, parameter) -> table, only of one run
+        self.lock = threading.Lock()
+
+
+    # Only assets of a forecast run can be stored, they never change once published
+    def accepts(self, url):
+        return runPattern.search(url.split('?')[0]) is not None
+
+
+    def getTable(self, url, parameter, asFloat=True):
+        run = runPattern.search(url.split('?')[0]).group(1)
+        key = (run, parameter)
+        with self.lock:
+            if key in self.tables:
+                return self.tables[key]
+
+        valuesFile = os.path.join(self.directory, run, parameter + ".npy")
+        indexFile = os.path.join(self.directory, run, parameter + ".json")
+        try:
+            table = self._load(valuesFile, indexFile)
+        except (OSError, ValueError):
+            self._build(url, parameter, asFloat, valuesFile, indexFile)
+            table = self._load(valuesFile, indexFile)
+
+        with self.lock:
+            if any(tableRun != run for tableRun, tableParameter in self.tables):
+                # A new run got opened, the maps of the previous one get closed once their tables are no longer used
+                self.tables = {tableKey: tableValue for tableKey, tableValue in self.tables.items() if tableKey[0] == run}
+            self.tables[key] = table
+        return table
+
+
+    def _load(self, valuesFile, indexFile):
+        with open(indexFile) as f:
+            index = json.load(f)
+        values = np.load(valuesFile, mmap_mode='r')
+        return ParameterTable(index['dates'], [tuple(p) for p in index['points']], values)
+
+
+    def _build(self, url, parameter, asFloat, valuesFile, indexFile):
+        logging.debug("Converting %s from %r to a columnar table..." % (parameter, url))
+        pointRows = {}
+        dateColumns = {}
+        rows = array.array('q')
+        columns = array.array('q')
+        values = array.array('d')
+
+        handle = self.openStream(url)
+        try:
+            header = handle.readline().decode('latin1').rstrip('\r\n').split(';')
+            pointIdIdx = header.index('point_id')
+            pointTypeIdx = header.index('point_type_id')
+            dateIdx = header.index('Date')
+            valueIdx = header.index(parameter)
+            for line in handle:
+                row = line.rstrip(b'\r\n').split(b';')
+                date = row[dateIdx]
+                if not date:
+                    continue
+                try:
+                    value = float(row[valueIdx])
+                except ValueError:
+                    continue
+                rows.append(pointRows.setdefault((row[pointIdIdx], row[pointTypeIdx]), len(pointRows)))
+                columns.append(dateColumns.setdefault(date, len(dateColumns)))
+                values.append(value)
+        finally:
+            handle.close()
+
+        # Order the columns by date, the rows stay in the order of the file
+        dates = sorted(dateColumns)
+        columnOrder = np.empty(len(dates), dtype=np.int64)
+        for column, date in enumerate(dates):
+            columnOrder[dateColumns[date]] = column
+
+        rows = np.frombuffer(rows, dtype=np.int64)
+        columns = columnOrder[np.frombuffer(columns, dtype=np.int64)]
+        values = np.frombuffer(values, dtype=np.float64)
+        if asFloat:
+            table = np.full((len(pointRows), len(dates)), np.nan, dtype=np.float32)
+            table[rows, columns] = values
+        else:
+            dtype = np.int16
+            if len(values) and (values.min() <= missingInt or values.max() > np.iinfo(np.int16).max):
+                dtype = np.int32
+            table = np.full((len(pointRows), len(dates)), missingInt, dtype=dtype)
+            table[rows, columns] = values.astype(dtype)
+
+        runDirectory = os.path.dirname(valuesFile)
+        if not os.path.isdir(runDirectory):
+            os.makedirs(runDirectory, exist_ok=True)
+            self.prune()
+
+        index = {
+            'dates': [date.decode('latin1') for date in dates],
+            'points': [[pointId.decode('latin1'), pointType.decode('latin1')] for pointId, pointType in pointRows],
+        }
+        # Write to temporary files first, so concurrent readers never see a partial table
+        handle, tempName = tempfile.mkstemp(dir=runDirectory, prefix=".tmp-", suffix=".npy")
+        with os.fdopen(handle, 'wb') as f:
+            np.save(f, table)
+        os.replace(tempName, valuesFile)
+        handle, tempName = tempfile.mkstemp(dir=runDirectory, prefix=".tmp-")
+        with os.fdopen(handle, 'w') as f:
+            json.dump(index, f)
+        os.replace(tempName, indexFile)
+        logging.debug("Stored %s as %d x %d table in %s" % (parameter, table.shape[0], table.shape[1], valuesFile))
+
+
+    """
+    Removes the tables of runs which are older than maxAge.
+    """
+    def prune(self):
+        now = time.time()
+        try:
+            runs = os.listdir(self.directory)
+        except OSError:
+            return
+        for run in runs:
+            path = os.path.join(self.directory, run)
+            try:
+                if now - os.path.getmtime(path) > self.maxAge:
+                    shutil.rmtree(path)
+            except OSError:
+                pass
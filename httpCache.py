@@ -0,0 +1,357 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib3
+import forecastMetrics
+
+
+# Forecast run assets (eg. "vnut12.lssw.202511181200.tre200h0.csv") never change once they got published
+immutablePattern = re.compile(r'\.\d{12}\.\w+\.csv$')
+
+# Files of the cache entries (see HttpCache._paths()), other files in the directory are left alone by prune()
+entryPattern = re.compile(r'^[0-9a-f]{40}\.(body|json)$')
+
+
+# Settings of the shared connection pool, see configure()
+timeout = urllib3.Timeout(connect=10, read=60)
+maxConnectionsPerHost = 10
+defaultHeaders = {'User-Agent': 'Mozilla/5.0', 'Accept-Encoding': 'gzip, deflate'}
+
+_pool = None
+_poolLock = threading.Lock()
+
+
+"""
+Sets the timeouts (seconds) and the maximum number of concurrent connections per host.
+The shared connection pool gets recreated with the new settings on the next request.
+"""
+def configure(connectTimeout=None, readTimeout=None, connectionsPerHost=None):
+    global timeout, maxConnectionsPerHost, _pool
+    with _poolLock:
+        timeout = urllib3.Timeout(connect=connectTimeout if connectTimeout is not None else timeout.connect_timeout,
+                                  read=readTimeout if readTimeout is not None else timeout.read_timeout)
+        if connectionsPerHost:
+            maxConnectionsPerHost = connectionsPerHost
+        _pool = None
+
+
+# Returns the thread-safe connection pool shared by all requests, connections are kept alive between them
+def getPool():
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            _pool = urllib3.PoolManager(num_pools=10, maxsize=maxConnectionsPerHost, block=True, timeout=timeout)
+        return _pool
+
+
+"""
+Readable stream of a pooled response (gzip/deflate get decoded transparently).
+Closing it returns the connection to the pool if the response got read completely.
+"""
+class _PooledResponse(io.RawIOBase):
+
+    def __init__(self, response):
+        self.response = response
+        self.complete = False
+        self.bytesRead = 0
+
+
+    def readable(self):
+        return True
+
+
+    def readinto(self, buffer):
+        n = self.response.readinto(buffer)
+        if not n:
+            self.complete = True
+        self.bytesRead += n or 0
+        return n
+
+
+    def close(self):
+        if self.closed:
+            return
+        if self.complete:
+            self.response.release_conn()
+        else:
+            self.response.close()
+        super().close()
+
+
+"""
+Opens a URL and returns the tuple (status, response headers, response).
+The response is a readable binary stream which has to be closed by the caller.
+A "304 Not Modified" answer gets returned with the response set to None.
+"""
+def openUrl(url, headers=None):
+    requestHeaders = dict(defaultHeaders)
+    if headers:
+        requestHeaders.update(headers)
+    response = getPool().request('GET', url, headers=requestHeaders, preload_content=False, decode_content=True)
+    if response.status == 304:
+        response.drain_conn()
+        response.release_conn()
+        return 304, response.headers, None
+    if response.status >= 400:
+        response.drain_conn()
+        response.release_conn()
+        raise Exception("HTTP Error %d: %s" % (response.status, response.reason))
+    return response.status, response.headers, io.BufferedReader(_PooledResponse(response), 256 * 1024)
+
+
+"""
+Fetches a URL and returns the tuple (status, response headers, content).
+A "304 Not Modified" answer gets returned with content set to None.
+"""
+def fetch(url, headers=None):
+    status, responseHeaders, response = openUrl(url, headers)
+    if response is None:
+        return status, responseHeaders, None
+    with response:
+        return status, responseHeaders, response.read()
+
+
+"""
+Passes the data of a response through while writing it to a temporary file.
+The file only gets added to the cache once the response got read completely.
+"""
+class _TeeStream(io.RawIOBase):
+
+    def __init__(self, cache, url, headers, response):
+        self.cache = cache
+        self.url = url
+        self.headers = headers
+        self.response = response
+        self.complete = False
+        self.bytesRead = 0
+        os.makedirs(cache.directory, exist_ok=True)
+        handle, self.tempName = tempfile.mkstemp(dir=cache.directory, prefix=".tmp-")
+        self.tempFile = os.fdopen(handle, 'wb')
+
+
+    def readable(self):
+        return True
+
+
+    def readinto(self, buffer):
+        n = self.response.readinto(buffer)
+        if n:
+            self.tempFile.write(memoryview(buffer)[:n])
+            self.bytesRead += n
+        else:
+            self.complete = True
+        return n
+
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.response.close()
+            self.tempFile.close()
+            if self.complete:
+                self.cache.commit(self.url, self.headers, self.tempName)
+            else:
+                os.remove(self.tempName)
+        except OSError as e:
+            logging.warning("Failed to cache %r: %s" % (self.url, e))
+        finally:
+            super().close()
+
+
+# Returns the number of bytes read so far from a stream returned by openUrl() or HttpCache.open(), None if unknown
+def getBytesRead(stream):
+    raw = getattr(stream, 'raw', stream)
+    if hasattr(raw, 'bytesRead'):
+        return raw.bytesRead
+    try:
+        return stream.tell() # cached file
+    except (OSError, ValueError):
+        return None
+
+
+"""
+Disk backed HTTP cache, keyed by URL.
+Every entry consists of the body and a small JSON file with the validators (ETag/Last-Modified).
+Cached entries get revalidated with a conditional request, immutable run assets get served without any request.
+"""
+class HttpCache:
+
+    def __init__(self, directory, maxAge=2 * 24 * 3600, pruneInterval=3600):
+        self.directory = directory
+        self.maxAge = maxAge # seconds an unused entry is kept
+        self.pruneInterval = pruneInterval # seconds between the scans for old entries
+        self.lastPrune = 0
+        self.pruneLock = threading.Lock()
+
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + ".body"), os.path.join(self.directory, key + ".json")
+
+
+    def isImmutable(self, url):
+        return immutablePattern.search(url.split('?')[0]) is not None
+
+
+    """
+    Returns the meta data and the body file name of a cached URL or (None, None) if it is not cached.
+    """
+    def getEntry(self, url):
+        bodyFile, metaFile = self._paths(url)
+        try:
+            with open(metaFile) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if meta.get('url') != url or not os.path.isfile(bodyFile):
+            return None, None
+        return meta, bodyFile
+
+
+    # Moves a completely downloaded temporary file into the cache
+    def commit(self, url, headers, tempName):
+        bodyFile, metaFile = self._paths(url)
+        os.replace(tempName, bodyFile)
+        self._writeMeta(url, headers)
+
+
+    def _writeMeta(self, url, headers):
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'lastModified': headers.get('Last-Modified'),
+            'fetched': int(time.time()),
+        }
+        self._writeAtomic(self._paths(url)[1], json.dumps(meta).encode('utf-8'))
+        if time.time() - self.lastPrune > self.pruneInterval:
+            self.prune()
+
+
+    def touch(self, url, meta):
+        bodyFile, metaFile = self._paths(url)
+        meta['fetched'] = int(time.time())
+        try:
+            self._writeAtomic(metaFile, json.dumps(meta).encode('utf-8'))
+        except OSError as e:
+            logging.warning("Failed to update cache entry of %r: %s" % (url, e))
+
+
+    def _writeAtomic(self, fileName, content):
+        # Write to a temporary file first, so concurrent readers never see a partial file
+        handle, tempName = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(content)
+            os.replace(tempName, fileName)
+        except BaseException:
+            try:
+                os.remove(tempName)
+            except OSError:
+                pass
+            raise
+
+
+    """
+    Removes entries which have not been used for longer than maxAge (eg. assets of old forecast runs).
+    Other files in the directory do not get touched.
+    """
+    def prune(self):
+        if not self.pruneLock.acquire(blocking=False):
+            return # already pruning in another thread
+        try:
+            self.lastPrune = time.time()
+            self._removeOldEntries()
+        finally:
+            self.pruneLock.release()
+
+
+    def _removeOldEntries(self):
+        now = time.time()
+        try:
+            fileNames = os.listdir(self.directory)
+        except OSError:
+            return
+        for fileName in fileNames:
+            if not entryPattern.match(fileName):
+                continue
+            path = os.path.join(self.directory, fileName)
+            try:
+                if now - os.path.getmtime(path) > self.maxAge:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+    """
+    Returns a readable binary stream of the URL, using the cached copy whenever possible.
+    Fresh downloads get streamed and written to the cache while being read.
+    """
+    def open(self, url):
+        meta, bodyFile = self.getEntry(url)
+        if meta is not None and self.isImmutable(url):
+            logging.debug("Cache hit (immutable) for %r" % url)
+            forecastMetrics.annotate(cache="hit")
+            # Both files count as used, so prune() removes neither of them
+            os.utime(bodyFile)
+            os.utime(self._paths(url)[1])
+            return open(bodyFile, 'rb')
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('lastModified'):
+                headers['If-Modified-Since'] = meta['lastModified']
+
+        cacheState = "notModified"
+        try:
+            status, responseHeaders, response = openUrl(url, headers)
+        except Exception as e:
+            if meta is None:
+                raise
+            logging.warning("Failed to revalidate %r, using cached copy: %s" % (url, e))
+            status, response, cacheState = 304, None, "stale"
+
+        if status == 304:
+            if meta is None:
+                # Only a broken server or proxy answers a request without conditional headers like this
+                raise Exception("Got \"304 Not Modified\" for %r without having a cached copy" % url)
+            logging.debug("Cache hit (not modified) for %r" % url)
+            forecastMetrics.annotate(cache=cacheState)
+            os.utime(bodyFile)
+            self.touch(url, meta)
+            return open(bodyFile, 'rb')
+
+        forecastMetrics.annotate(cache="miss")
+        try:
+            return io.BufferedReader(_TeeStream(self, url, responseHeaders, response), 256 * 1024)
+        except OSError as e:
+            logging.warning("Failed to cache %r: %s" % (url, e))
+            return response
+
+
+    """
+    Makes sure the cached copy of the URL is up to date and returns its meta data and body file name.
+    Returns (None, None) if the content could not be cached.
+    """
+    def getFile(self, url):
+        with self.open(url) as handle:
+            if isinstance(getattr(handle, 'raw', None), _TeeStream):
+                while handle.read(1024 * 1024):
+                    pass
+        return self.getEntry(url)
+
+
+    """
+    Returns the content of the URL, using the cached copy whenever possible.
+    """
+    def get(self, url):
+        with self.open(url) as handle:
+            return handle.read()
@@ -0,0 +1,117 @@
+import io
+import os
+import tempfile
+import numpy as np
+from PIL import Image
+
+
+"""
+Encoders of the rendered graphs, they trade CPU time against file size.
+An image format is given as "<name>[:<option>=<value>,...]", eg. "png:level=9,optimize", "webp" or "palette:colors=16".
+ - png: level (zlib compression level 0-9, default 6), optimize (search the smallest encoding, slow)
+ - webp: lossless (default 1), quality (0-100, lossless: effort, default 80), method (0-6, default 4)
+ - palette: PNG with a palette of at most <colors> colors (default 256), level and optimize as with png
+ - rgba: uncompressed RGBA pixels, 4 bytes per pixel row by row (size is in the meta data)
+"""
+imageFormats = {
+    # name -> (content type, {option -> (type, default)})
+    'png': ("image/png", {'level': (int, 6), 'optimize': (bool, False)}),
+    'webp': ("image/webp", {'lossless': (bool, True), 'quality': (int, 80), 'method': (int, 4)}),
+    'palette': ("image/png", {'colors': (int, 256), 'level': (int, 6), 'optimize': (bool, False)}),
+    'rgba': ("application/octet-stream", {}),
+}
+
+defaultImageFormat = "png"
+
+
+"""
+Parses an image format string and returns the tuple (name, options) with all options set.
+Raises an exception if the format or one of its options is unknown.
+"""
+def parseImageFormat(imageFormat):
+    if not imageFormat:
+        imageFormat = defaultImageFormat
+    name, _, optionString = imageFormat.partition(':')
+    name = name.strip().lower()
+    if name not in imageFormats:
+        raise Exception("Unknown image format %r, use one of %s" % (name, ", ".join(imageFormats)))
+    contentType, optionTypes = imageFormats[name]
+
+    options = {option: default for option, (optionType, default) in optionTypes.items()}
+    for item in optionString.split(','):
+        if not item.strip():
+            continue
+        option, hasValue, value = item.partition('=')
+        option = option.strip()
+        if option not in optionTypes:
+            raise Exception("Unknown option %r of the image format %s" % (option, name))
+        optionType = optionTypes[option][0]
+        if optionType == bool:
+            options[option] = not hasValue or value.strip().lower() not in ("0", "false", "no")
+        else:
+            try:
+                options[option] = optionType(value)
+            except ValueError:
+                raise Exception("Invalid value %r of the option %s of the image format %s" % (value, option, name))
+    return name, options
+
+
+# Returns the content type (eg. "image/png") of an image format
+def getContentType(imageFormat):
+    return imageFormats[parseImageFormat(imageFormat)[0]][0]
+
+
+"""
+Encodes an image (RGBA array or PIL image) in the given image format and returns the encoded bytes.
+"""
+def encodeImage(image, imageFormat=None):
+    name, options = parseImageFormat(imageFormat)
+    if isinstance(image, np.ndarray):
+        if name == 'rgba':
+            return np.ascontiguousarray(image, dtype=np.uint8).tobytes()
+        image = Image.fromarray(image, 'RGBA')
+    elif name == 'rgba':
+        return image.convert('RGBA').tobytes()
+
+    output = io.BytesIO()
+    if name == 'png':
+        image.save(output, format='PNG', compress_level=options['level'], optimize=options['optimize'])
+    elif name == 'palette':
+        # Fast octree supports the alpha channel, no dithering keeps the flat areas and lines of the graph clean
+        paletteImage = image.convert('RGBA').quantize(colors=max(2, min(256, options['colors'])), method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        paletteImage.save(output, format='PNG', compress_level=options['level'], optimize=options['optimize'])
+    elif name == 'webp':
+        image.save(output, format='WEBP', lossless=options['lossless'], quality=options['quality'], method=options['method'])
+    return output.getvalue()
+
+
+# Returns the permissions of the existing file, or the ones a new file gets with the current umask
+def _getFileMode(fileName):
+    try:
+        return os.stat(fileName).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+"""
+Writes encoded image data to a file.
+The data gets written to a temporary file first, so a reader never sees a partially written image.
+An existing image keeps its permissions, a new one gets them from the umask like with open().
+"""
+def writeImageFile(fileName, content):
+    directory = os.path.dirname(os.path.abspath(fileName))
+    mode = _getFileMode(fileName)
+    handle, tempName = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(content)
+        os.chmod(tempName, mode)
+        os.replace(tempName, fileName)
+    except BaseException:
+        try:
+            os.remove(tempName)
+        except OSError:
+            pass
+        raise
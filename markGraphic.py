@@ -1,11 +1,14 @@
 import logging
 import argparse
+import concurrent.futures
+import os
 import time
 import datetime
 import pytz
 import json
 from PIL import Image, ImageDraw
-import datetime, pytz
+import imageEncoder
+import forecastMetrics
 
 
 # Returns the current UTC offset as integer value.
@@ -16,78 +19,271 @@ def getCurrentUtcOffset():
     return utcOffset
 
 
-def markGraphic(inputFile, outputFile, metaFile, x, y, w, h, fakeTime, test, utcOffset=None):
-    logging.debug("X: %d, Y: %d, width: %d, height: %d" % (x, y, w, h))
+# Returns the offset from the local time of the system to UTC in hours
+def getSystemUtcOffset():
+    # See also https://stackoverflow.com/questions/3168096/getting-computers-utc-offset-in-python
+    ts = time.time()
+    utcOffset = (datetime.datetime.fromtimestamp(ts) -
+                datetime.datetime.fromtimestamp(ts, datetime.UTC).replace(tzinfo=None)).total_seconds()
+    return int(utcOffset / 3600) # in hours
+
 
+"""
+Returns the x position (pixel) of the current time mark.
+x, w: start and width of the first day in pixel
+"""
+def getMarkPosition(x, w, utcOffset, fakeTime=None, now=None):
     pixelPerMinute = float(w) / (24 * 60)
     logging.debug("Pixel per Minute: %f, per hour: %f" % (pixelPerMinute, pixelPerMinute * 60))
 
-    im = Image.open(inputFile)
-    imageWidth, imageHeight = im.size
-    logging.debug("Dimension of the graph: %d, %d" % (imageWidth, imageHeight))
+    if fakeTime:
+        hour = int(fakeTime[0:2])
+        minute = int(fakeTime[3:5])
+    else: # use current time
+        now = datetime.datetime.fromtimestamp(now) if now is not None else datetime.datetime.now()
+        hour = now.hour
+        minute = now.minute
+    logging.debug("Time: %02d:%02d" % (hour, minute))
 
-    d = ImageDraw.Draw(im)
+    return x + pixelPerMinute * ((hour + utcOffset) * 60 + minute)
 
-    y = imageHeight - y # swap top/bottom coordination system
-    h *= -1
 
-    if test:
-        logging.info("Going to draw a red frame around the first day")
-        d.line([(x, y), (x, y + h)], fill='red', width=1) # left side
-        d.line([(x + w, y), (x + w, y + h)], fill='red', width=1) # right side
-        d.line([(x, y), (x + w, y)], fill='red', width=1) # top
-        d.line([(x, y + h), (x + w, y + h)], fill='red', width=1) # bottom
+# Guesses the image format of the output file from its extension, see imageEncoder.py
+def getImageFormatOfFile(fileName):
+    if fileName.lower().endswith(".webp"):
+        return "webp"
+    return "png"
 
 
-    if utcOffset == None:
-        # Get offset from local time to UTC, see also https://stackoverflow.com/questions/3168096/getting-computers-utc-offset-in-python
-        ts = time.time()
-        utcOffset = (datetime.datetime.fromtimestamp(ts) -
-                    datetime.datetime.fromtimestamp(ts, datetime.UTC)).total_seconds()
-        utcOffset = int(utcOffset / 3600) # in hours
-    else:
-        utcOffset = utcOffset
+"""
+Adds the current time mark to a forecast graph.
+The decoded graph and its meta data are kept in memory and only get loaded again when their files change,
+so marking it every minute only redraws the column strip of the mark and encodes the image.
+Without an input file, the graph has to be passed with setBaseImage(), eg. directly from generateGraph().
+Without an output file, the marked graph only gets kept in memory (image).
+x, y, w, h: Position and size (pixel) of the first day, y from the bottom. Missing values get taken from the meta data (firstDayX, firstDayY, dayWidth, dayHeight).
+"""
+class GraphicMarker:
 
-    logging.debug("UTC offset: %d" % utcOffset)
-    
+    def __init__(self, inputFile, outputFile, metaFile=None, x=None, y=None, w=None, h=None, utcOffset=None, test=False, imageFormat=None):
+        self.inputFile = inputFile
+        self.outputFile = outputFile
+        self.metaFile = metaFile
+        self.geometry = (x, y, w, h)
+        self.utcOffset = utcOffset # None: use the offset of the system time
+        self.test = test
+        self.imageFormat = imageFormat if imageFormat or not outputFile else getImageFormatOfFile(outputFile)
+        self.fileStates = None # (size, mtime) of the input and meta file when they got loaded
+        self.baseImage = None
+        self.metaData = None
+        self.image = None # base image with the current mark
+        self.markedStrip = None # box of the base image which got changed by the mark
+        self.written = False
+        self.writtenMark = None # mark position of the last written output, None if the graph does not show the current time
 
-    if metaFile:
-        with open(metaFile) as f:
-            metaData = json.load(f)
-        logging.debug("%d seconds since last model generation" % (datetime.datetime.utcnow().timestamp() + utcOffset * 3600 - metaData['modelTimestamp']))
 
-        # TODO check if mode got generated yesterday. if so, the current time must be shown on the 2nd day shown instead of the first! 
+    def _getFileState(self, fileName):
+        if not fileName:
+            return None
+        stat = os.stat(fileName)
+        return stat.st_size, stat.st_mtime_ns
 
 
-    if fakeTime:
-        hour = int(fakeTime[0:2])
-        minute = int(fakeTime[3:5])
-    else: # use current time
-        hour = datetime.datetime.now().hour
-        minute = datetime.datetime.now().minute
-    logging.debug("Time: %02d:%02d" % (hour, minute))
+    """
+    Sets the graph to be marked and its meta data (dict), eg. the result of generateGraph(..., returnImage="image").
+    The output gets written with the next call of mark().
+    """
+    def setBaseImage(self, image, metaData=None):
+        # eg. palette images get converted, the red mark must not depend on their palette
+        self.baseImage = image.copy() if image.mode in ('RGB', 'RGBA') else image.convert('RGBA')
+        self.metaData = metaData
+        self.image = self.baseImage.copy()
+        self.markedStrip = None
+        self.written = False
+        self.fileStates = None
+        logging.debug("Dimension of the graph: %d, %d" % self.baseImage.size)
+
+
+    # Loads the base image and the meta data again if one of the files changed, returns True if they got loaded
+    def reload(self):
+        if not self.inputFile:
+            return False
+        fileStates = (self._getFileState(self.inputFile), self._getFileState(self.metaFile))
+        if fileStates == self.fileStates:
+            return False
+
+        metaData = None
+        if self.metaFile:
+            with open(self.metaFile) as f:
+                metaData = json.load(f)
+
+        logging.debug("Loading %s" % self.inputFile)
+        with Image.open(self.inputFile) as im:
+            self.setBaseImage(im, metaData)
+        self.fileStates = fileStates
+        return True
+
+
+    # Returns the position and size of the first day (x, y, w, h) in pixel, y from the bottom
+    def getGeometry(self):
+        metaNames = ['firstDayX', 'firstDayY', 'dayWidth', 'dayHeight']
+        geometry = []
+        for value, metaName in zip(self.geometry, metaNames):
+            if value is None:
+                if not self.metaData or metaName not in self.metaData:
+                    raise Exception("The %s of the first day is neither given nor in the meta data" % metaName)
+                value = int(self.metaData[metaName])
+            geometry.append(value)
+        return tuple(geometry)
+
+
+    """
+    Returns the x position (pixel) of the current time mark or None if the current time is not shown in the graph.
+    The meta data of the graph tells when the first day starts, so the mark also ends up on the right day
+    if the forecast run is from yesterday. Meta files without it are assumed to start today.
+    """
+    def getMarkPosition(self, x, w, utcOffset, fakeTime=None, now=None):
+        if not self.metaData or 'firstDayTimestamp' not in self.metaData:
+            return getMarkPosition(x, w, utcOffset, fakeTime, now)
 
-    pixelPerTime = pixelPerMinute * ((hour + utcOffset) * 60 + minute)
+        elapsed = now - self.metaData['firstDayTimestamp'] # seconds since the start of the first day
+        if fakeTime:
+            elapsed = elapsed // (24 * 3600) * (24 * 3600) + int(fakeTime[0:2]) * 3600 + int(fakeTime[3:5]) * 60
+        logging.debug("Day %d of the graph, %02d:%02d" % (elapsed // (24 * 3600) + 1, elapsed % (24 * 3600) // 3600, elapsed % 3600 // 60))
+        if not 0 <= elapsed < self.metaData.get('noOfDays', 1) * 24 * 3600:
+            return None
+        return x + float(w) / (24 * 3600) * elapsed
 
-    d.line([(x + pixelPerTime, y - 1), (x + pixelPerTime, y + h)], fill='red', width=2)
 
-    im.save(outputFile)
+    """
+    Draws the mark of the current time and writes the output file.
+    The output only gets written if the mark moved by at least one pixel or the input changed.
+    now: Current time (seconds since the epoch), eg. to use the same time for several graphs
+    Returns True if the marked graph changed.
+    """
+    @forecastMetrics.timed("markGraphic")
+    def mark(self, fakeTime=None, now=None):
+        if now is None:
+            now = time.time()
+        self.reload()
+        x, y, w, h = self.getGeometry()
+        logging.debug("X: %d, Y: %d, width: %d, height: %d" % (x, y, w, h))
+
+        if self.utcOffset == None:
+            utcOffset = getSystemUtcOffset()
+        else:
+            utcOffset = self.utcOffset
+        logging.debug("UTC offset: %d" % utcOffset)
+
+        if self.metaData:
+            logging.debug("%d seconds since last model generation" % (now - self.metaData['modelTimestamp']))
+
+        markX = self.getMarkPosition(x, w, utcOffset, fakeTime, now)
+        if markX is not None:
+            markX = int(markX) # the drawn line starts at the truncated position
+        if self.written and markX == self.writtenMark:
+            logging.debug("Mark did not move, keeping %s" % self.outputFile)
+            forecastMetrics.annotate(written=False)
+            return False
+
+        if self.markedStrip:
+            # Restore the pixels of the previous mark instead of copying the whole image
+            self.image.paste(self.baseImage.crop(self.markedStrip), self.markedStrip[:2])
+
+        imageHeight = self.image.height
+        top = imageHeight - y # swap top/bottom coordination system
+        d = ImageDraw.Draw(self.image)
+        if self.test:
+            logging.info("Going to draw a red frame around the first day")
+            d.line([(x, top), (x, top - h)], fill='red', width=1) # left side
+            d.line([(x + w, top), (x + w, top - h)], fill='red', width=1) # right side
+            d.line([(x, top), (x + w, top)], fill='red', width=1) # top
+            d.line([(x, top - h), (x + w, top - h)], fill='red', width=1) # bottom
+
+        self.markedStrip = None
+        if markX is not None:
+            d.line([(markX, top - 1), (markX, top - h)], fill='red', width=2)
+            self.markedStrip = (max(0, markX - 2), 0, min(self.image.width, markX + 3), imageHeight)
+        else:
+            logging.info("The current time is not shown in the graph, writing it without mark")
+        if self.test:
+            self.markedStrip = (0, 0, self.image.width, imageHeight)
+
+        forecastMetrics.annotate(written=True)
+        if self.outputFile:
+            logging.debug("Saving %s" % self.outputFile)
+            forecastMetrics.phase("encode")
+            imageEncoder.writeImageFile(self.outputFile, imageEncoder.encodeImage(self.image, self.imageFormat))
+        self.written = True
+        self.writtenMark = markX
+        return True
+
+
+def markGraphic(inputFile, outputFile, metaFile, x, y, w, h, fakeTime, test, utcOffset=None):
+    marker = GraphicMarker(inputFile, outputFile, metaFile=metaFile, x=x, y=y, w=w, h=h, utcOffset=utcOffset, test=test)
+    marker.mark(fakeTime=fakeTime)
+
+
+"""
+Reads a manifest (JSON) with the graphs to be marked and returns a GraphicMarker for each of them, eg.
+[{"input": "forecast-8001.png", "meta": "meta-8001.json", "output": "marked-8001.png"}, ...]
+Every entry can also contain "x", "y", "w", "h" (instead of the values in the meta file) and "imageFormat" (instead of the given one).
+"""
+def loadManifest(manifestFile, utcOffset=None, test=False, imageFormat=None):
+    with open(manifestFile) as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise Exception("The manifest must contain a list of graphs")
+
+    markers = []
+    for entry in entries:
+        if not entry.get('input') or not entry.get('output'):
+            raise Exception("Every graph of the manifest needs an input and an output: %r" % entry)
+        if not entry.get('meta') and any(entry.get(name) is None for name in ['x', 'y', 'w', 'h']):
+            raise Exception("Graph %s needs a meta file or x, y, w and h" % entry['input'])
+        entryImageFormat = entry.get('imageFormat', imageFormat)
+        imageEncoder.parseImageFormat(entryImageFormat)
+        markers.append(GraphicMarker(entry['input'], entry['output'], metaFile=entry.get('meta'), x=entry.get('x'), y=entry.get('y'), w=entry.get('w'), h=entry.get('h'), utcOffset=utcOffset, test=test, imageFormat=entryImageFormat))
+    return markers
+
+
+"""
+Marks several graphs in parallel threads, all of them with the same current time.
+Returns the number of graphs which failed.
+"""
+def markGraphics(markers, executor, fakeTime=None):
+    now = time.time()
+    futures = {executor.submit(marker.mark, fakeTime=fakeTime, now=now): marker for marker in markers}
+    failed = 0
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            future.result()
+        except Exception as e:
+            # eg. the forecast graph is being replaced, it gets tried again the next time
+            logging.error("Failed to mark %s: %s" % (futures[future].inputFile, e))
+            failed += 1
+    return failed
 
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Script to take a forecast graph image file (png) and add a mark to the current time')
     parser.add_argument('-v', action='store_true', help='Verbose output')
-    parser.add_argument('-i', action='store', type=argparse.FileType('r'), required=True,  help='Input file name of the graph image (png)')
-    parser.add_argument('-m', action='store', type=argparse.FileType('r'), default=None, help='Meta file to be used (json)')
-    parser.add_argument('-o', action='store', type=argparse.FileType('w'), required=True,  help='Output file name of the graph image (png)')
-    parser.add_argument('-x', action='store', type=int, required=True, help='start-x pixel of first day')
-    parser.add_argument('-y', action='store', type=int, required=True, help='start-y pixel of first day')
-    parser.add_argument('-H', action='store', type=int, required=True, help='Height of the day in pixel')
-    parser.add_argument('-w', action='store', type=int, required=True, help='Width of the day in pixel')
+    parser.add_argument('-i', action='store', help='Input file name of the graph image (png)')
+    parser.add_argument('-m', action='store', default=None, help='Meta file to be used (json)')
+    parser.add_argument('-o', action='store', help='Output file name of the graph image (png)')
+    parser.add_argument('-x', action='store', type=int, help='start-x pixel of first day, default is firstDayX of the meta file')
+    parser.add_argument('-y', action='store', type=int, help='start-y pixel of first day, default is firstDayY of the meta file')
+    parser.add_argument('-H', action='store', type=int, help='Height of the day in pixel, default is dayHeight of the meta file')
+    parser.add_argument('-w', action='store', type=int, help='Width of the day in pixel, default is dayWidth of the meta file')
     parser.add_argument('--utc-offset', action='store', type=int, help='Offset to UTC, only needed if system does not know it', default=None)
     parser.add_argument('--fake-time', action='store', default=False, help='Time to fake, in the format hh:mm')
     parser.add_argument('--test', action='store_true', default=False, help='Draws a border around the day for testing the coordinate and size')
+    parser.add_argument('--image-format', action='store', default=None, help='Encoding of the output, eg. "png:level=1" or "webp", see imageEncoder.py. Default is taken from the file extension')
+    parser.add_argument('--watch', action='store_true', help='Keep running and update the mark every minute. The input and meta file only get loaded again when they change')
+    parser.add_argument('--batch', action='store', help='Manifest (JSON) with the graphs to be marked instead of -i/-o/-m, eg. [{"input": "forecast-8001.png", "meta": "meta-8001.json", "output": "marked-8001.png"}]')
+    parser.add_argument('--threads', action='store', type=int, help='Number of threads marking the graphs of the manifest, default is the number of CPUs', default=None)
+    parser.add_argument('--metrics', action='append', help='Report the timing of the marking after every round: "log", "json:<file>" or "prometheus:<file>", see forecastMetrics.py. Can be given multiple times', default=[])
 
     args = parser.parse_args()
 
@@ -95,13 +291,55 @@ if __name__ == '__main__':
     if args.v:
         logLevel = logging.DEBUG
 
+    logging.basicConfig(format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%d-%b-%y %H:%M:%S', level=logLevel)
+    logging.getLogger("PIL").setLevel(logging.WARNING) # hiding the debug messages from the PIL
+
+    if not args.batch:
+        if not args.i or not args.o:
+            parser.error("-i and -o are required without a manifest (--batch)")
+        if not args.m and None in (args.x, args.y, args.w, args.H):
+            parser.error("-x, -y, -w and -H are required without a meta file (-m)")
+        if not os.path.isfile(args.i):
+            parser.error("Input file %s not found" % args.i)
+    try:
+        imageEncoder.parseImageFormat(args.image_format)
+        for description in args.metrics:
+            forecastMetrics.addSink(forecastMetrics.createSink(description))
+    except Exception as e:
+        parser.error(str(e))
+
     if args.utc_offset:
         utcOffset = args.utc_offset
     else:
         utcOffset = getCurrentUtcOffset()
 
-    logging.basicConfig(format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%d-%b-%y %H:%M:%S', level=logLevel)
+    if args.batch:
+        try:
+            markers = loadManifest(args.batch, utcOffset=utcOffset, test=args.test, imageFormat=args.image_format)
+        except Exception as e:
+            parser.error("Failed to read the manifest: %s" % e)
+    else:
+        markers = [GraphicMarker(args.i, args.o, metaFile=args.m, x=args.x, y=args.y, w=args.w, h=args.H, utcOffset=utcOffset, test=args.test, imageFormat=args.image_format)]
+        if not args.watch:
+            markers[0].mark(fakeTime=args.fake_time)
+            forecastMetrics.flush()
+            exit(0)
+
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as executor:
+        try:
+            while True:
+                failed = markGraphics(markers, executor, fakeTime=args.fake_time)
+                forecastMetrics.flush()
+                if not args.watch:
+                    break
+                time.sleep(60 - time.time() % 60) # wake up at the start of the next minute
+                if not args.utc_offset:
+                    utcOffset = getCurrentUtcOffset() # follows the daylight saving time
+                    for marker in markers:
+                        marker.utcOffset = utcOffset
+        except KeyboardInterrupt:
+            pass
 
-    markGraphic(inputFile=args.i.name, outputFile=args.o.name, metaFile=args.m, x=args.x, y=args.y, w=args.w, h=args.h, utcOffset=utcOffset, fakeTime=args.fake_time, test=args.test)
-    
-    
+    if failed:
+        exit(1)
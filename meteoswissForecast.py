@@ -1,31 +1,31 @@
-from urllib.request import Request, urlopen
 import json
 import pprint
 import time
 import datetime
 import pytz
 import locale
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
-from matplotlib.collections import PatchCollection
-from matplotlib.patches import Circle, Rectangle
-from matplotlib.offsetbox import TextArea, DrawingArea, OffsetImage, AnnotationBbox
-import matplotlib.lines as mlines
 import concurrent.futures
+import asyncio
 import functools
-import matplotlib.patheffects as path_effects
-from matplotlib.ticker import FormatStrFormatter
 import numpy as np
 import math
 import logging
-import csv
 import calendar
 import re
 import io
 import argparse
 import os.path
 import json
-from scipy import interpolate
+import httpCache
+import forecastMetrics
+import forecastStore
+import pointIndex
+import stacIndex
+from forecastData import maximumNumberOfDays, limitDataToDays
+# The graph rendering (matplotlib, scipy) is in forecastGraph.py, it only gets imported when a graph gets rendered
+import hashlib
+import threading
+import weakref
 # import measurementDataProvider
 
 
@@ -34,18 +34,55 @@ from scipy import interpolate
 #import tempfile
 
 
-# Meteoswiss only provides the data of the up to 9 days.
-maximumNumberOfDays = 9
+# Downloads get cached on disk, see setCacheDirectory()
+defaultCacheDirectory = os.environ.get('METEOSWISS_FORECAST_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'meteoswiss-forecast'))
+_httpCache = httpCache.HttpCache(defaultCacheDirectory)
+
+# Maximum number of parallel downloads when collecting the data
+maxConcurrentDownloads = 10
+_downloadSemaphores = weakref.WeakKeyDictionary() # event loop -> semaphore shared by all its downloads
+
+# Optional columnar store of the forecast runs, see setForecastStoreDirectory()
+_forecastStore = None
+
+# Point metadata index per URL: (index, load time), see getPointIndex()
+_pointIndexes = {}
+_pointIndexLock = threading.Lock()
+_pointIndexLoadLocks = {} # URL -> lock held while the index gets loaded
+pointIndexMaxAge = 3600 # seconds the index gets used before checking for a new metadata version
+
+# Parsed STAC responses per URL: (content hash, index), see getStacIndex()
+_stacIndexes = {}
+_stacIndexLock = threading.Lock()
+
+
+
+# Sets the directory used for the download cache, None disables the cache.
+def setCacheDirectory(directory):
+    global _httpCache
+    _httpCache = httpCache.HttpCache(directory) if directory else None
+    _download_cached.cache_clear()
+    _pointIndexes.clear()
+
+
+# Sets the directory used to store the forecast runs as memory-mapped tables, None disables the store.
+def setForecastStoreDirectory(directory):
+    global _forecastStore
+    _forecastStore = forecastStore.ForecastStore(directory, _openStream) if directory else None
 
 
 def _download(url):
     logging.debug("Downloading %r..." % url)
-    req = Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-    try:
-        with urlopen(req) as response:
-            content = response.read()
-    except Exception as e:
-        raise Exception("Failed to fetch URL (%r): %r" % (url, e))
+    with forecastMetrics.span("download", file=os.path.basename(url.split('?')[0])):
+        try:
+            if _httpCache:
+                content = _httpCache.get(url)
+            else:
+                forecastMetrics.annotate(cache="disabled")
+                content = httpCache.fetch(url)[2]
+        except Exception as e:
+            raise Exception("Failed to fetch URL (%r): %r" % (url, e))
+        forecastMetrics.annotate(bytes=len(content))
     logging.debug("Download completed %r: %.2f MB" % (url, len(content) / (1024 * 1024)))
     return content
 
@@ -55,6 +92,46 @@ def _download_cached(url):
     return _download(url)
 
 
+# Returns a readable binary stream of the URL, the data gets consumed incrementally
+def _openStream(url):
+    logging.debug("Opening %r..." % url)
+    try:
+        if _httpCache:
+            return _httpCache.open(url)
+        forecastMetrics.annotate(cache="disabled")
+        status, headers, response = httpCache.openUrl(url)
+        return response
+    except Exception as e:
+        raise Exception("Failed to fetch URL (%r): %r" % (url, e))
+
+
+# Converts CSV dates ("YYYYMMDDHHMM", UTC) to an int64 array of unix timestamps
+def _datesToTimestamps(dates):
+    d = np.array(dates).astype(np.int64)
+    years = (d // 100000000 - 1970).astype('datetime64[Y]')
+    months = (d // 1000000 % 100 - 1).astype('timedelta64[M]')
+    days = (d // 10000 % 100 - 1).astype('timedelta64[D]')
+    minutes = (d // 100 % 100 * 60 + d % 100).astype('timedelta64[m]')
+    return ((years + months).astype('datetime64[D]') + days + minutes).astype('datetime64[s]').astype(np.int64)
+
+
+# Returns the values of a series (date -> value) on the given dates as float array, missing values are NaN
+def _alignSeries(series, dates):
+    if list(series.keys()) == dates:
+        values = list(series.values())
+    else:
+        values = [series.get(date) for date in dates]
+    return np.array(values, dtype=float)
+
+
+# Converts a float array with NaN gaps back to a list of integers (and NaN)
+def _integerList(values):
+    missing = np.isnan(values)
+    integers = np.where(missing, 0, values).astype(np.int64).astype(object)
+    integers[missing] = np.nan
+    return integers.tolist()
+
+
 # Returns the current UTC offset as integer value.
 def getCurrentUtcOffset():
     utcOffset = datetime.datetime.now(pytz.timezone('Europe/Zurich')).strftime('%z')
@@ -84,18 +161,30 @@ class MeteoSwissForecast:
 
     textShadowWidth = 3 # pixel
 
+    # Parameters a forecast run must provide to be used
+    requiredParameters = [
+        'tre200h0', 'treq10h0', 'treq90h0', 'rre150h0',
+        'rreq10h0', 'rreq90h0', 'fu3010h0', 'fu3010h1',
+        'sre000h0', 'jww003i0',
+    ]
+
     utcOffset = 0
     days = 0
     data = {}
 
-    def __init__(self, zipCode, utcOffset=None):
+    # point: Optional tuple (point id, point type, city name), eg. as returned by findPoints(), to skip the lookup
+    def __init__(self, zipCode, utcOffset=None, point=None):
         self.zipCode = zipCode
+        self.data = {}
 
         logging.debug("Using data for location with zip code %d" % self.zipCode)
-        try:
-            self.cityName = self.getCityName()
-        except Exception as e:
-            raise Exception("Failed to get City name: %s" % e)
+        if point:
+            self.pointId, self.pointType, self.cityName = point
+        else:
+            try:
+                self.cityName = self.getCityName()
+            except Exception as e:
+                raise Exception("Failed to get City name: %s" % e)
 
         if utcOffset == None:
             # Get offset from local time to UTC, see also https://stackoverflow.com/questions/3168096/getting-computers-utc-offset-in-python
@@ -126,85 +215,34 @@ class MeteoSwissForecast:
 
 
     def getCityName(self):
-        logging.debug("Loading point metadata from %r..." % self.pointMetaUrl)
-        handle = self.getUrlText(self.pointMetaUrl)
-        try:
-            reader = csv.reader(handle, delimiter=';')
-            header = next(reader)
-            pointIdIdx = header.index('point_id')
-            pointTypeIdx = header.index('point_type_id')
-            postalCodeIdx = header.index('postal_code')
-            pointNameIdx = header.index('point_name')
-            for row in reader:
-                if row[postalCodeIdx] == str(self.zipCode) and row[pointTypeIdx] == '2':
-                    self.pointId = row[pointIdIdx]
-                    self.pointType = row[pointTypeIdx]
-                    self.cityName = row[pointNameIdx]
-                    logging.debug("The location is: %s" % self.cityName)
-                    return self.cityName
-        finally:
-            handle.close()
-        raise Exception("Unknown zip code: %d" % self.zipCode)
+        points = findPoints([self.zipCode])
+        if self.zipCode not in points:
+            raise Exception("Unknown zip code: %d" % self.zipCode)
+        self.pointId, self.pointType, self.cityName = points[self.zipCode]
+        logging.debug("The location is: %s" % self.cityName)
+        return self.cityName
 
 
     def getLatestForecastRun(self):
-        itemsUrl = self.stacCollectionUrl + "/items"
-        logging.debug("Loading STAC items from %r..." % itemsUrl)
-        items = self.getUrlJson(itemsUrl)
-        candidates = [f for f in items.get('features', []) if f.get('assets')]
-        if not candidates:
+        self.stacIndex = getStacIndex()
+        if not self.stacIndex.runs:
             raise Exception("No STAC items with assets found")
 
         # Choose the latest run that has every parameter we need
-        requiredParameters = [
-            'tre200h0', 'treq10h0', 'treq90h0', 'rre150h0',
-            'rreq10h0', 'rreq90h0', 'fu3010h0', 'fu3010h1',
-            'sre000h0', 'jww003i0',
-        ]
-        bestRun = None
-        bestItem = None
-        for item in candidates:
-            runs = {}
-            for key in item['assets']:
-                m = re.search(r'\.(\d{12})\.(\w+)\.csv$', key)
-                if not m:
-                    continue
-                run, parameter = m.group(1), m.group(2)
-                runs.setdefault(run, set()).add(parameter)
-            for run, parameters in runs.items():
-                if all(p in parameters for p in requiredParameters):
-                    if bestRun is None or run > bestRun:
-                        bestRun = run
-                        bestItem = item
-
+        bestRun = self.stacIndex.getLatestCompleteRun()
         if bestRun is None:
             raise Exception("No forecast run with all required parameters found")
 
-        self.stacItemId = bestItem['id']
-        self.itemAssets = bestItem['assets']
+        self.stacItemId, self.itemAssets = self.stacIndex.latestItemId, self.stacIndex.latestItemAssets
         self.latestRun = bestRun
         logging.debug("Using forecast run %r" % self.latestRun)
         return self.latestRun
 
 
     def getParameterAssetUrl(self, parameter, run=None):
-        if not hasattr(self, 'itemAssets') or not self.itemAssets:
+        if not hasattr(self, 'stacIndex') or not self.stacIndex:
             self.getLatestForecastRun()
-        candidates = {}
-        for key, asset in self.itemAssets.items():
-            if not key.endswith('.' + parameter + '.csv'):
-                continue
-            m = re.search(r'\.(\d{12})\.' + parameter + r'\.csv$', key)
-            if not m:
-                continue
-            candidates[m.group(1)] = asset['href']
-        if not candidates:
-            raise Exception("No asset found for parameter %r" % parameter)
-        if run is not None:
-            if run in candidates:
-                return candidates[run]
-            raise Exception("Run %r not available for parameter %r" % (run, parameter))
-        return candidates[max(candidates)]
+        return self.stacIndex.getAssetUrl(parameter, run)
 
 
     def _extractRun(self, forecastDataUrl):
@@ -224,41 +262,11 @@ class MeteoSwissForecast:
 
 
     def loadParameterSeries(self, url, parameter, asFloat=True):
-        logging.debug("Loading %s from %r..." % (parameter, url))
-        handle = self.getUrlText(url)
-        try:
-            reader = csv.reader(handle, delimiter=';')
-            header = next(reader)
-            pointIdIdx = header.index('point_id')
-            pointTypeIdx = header.index('point_type_id')
-            dateIdx = header.index('Date')
-            valueIdx = header.index(parameter)
-            series = {}
-            for row in reader:
-                if row[pointIdIdx] != self.pointId:
-                    continue
-                if row[pointTypeIdx] != self.pointType:
-                    continue
-                dateStr = row[dateIdx]
-                value = row[valueIdx]
-                if not dateStr:
-                    continue
-                if not value:
-                    parsed = None
-                else:
-                    try:
-                        if asFloat:
-                            parsed = float(value)
-                        else:
-                            parsed = int(value)
-                    except ValueError:
-                        parsed = None
-                series[dateStr] = parsed
-            if not series:
-                raise Exception("No data found for point %s/%s in %s" % (self.pointId, self.pointType, url))
-            return series
-        finally:
-            handle.close()
+        point = (self.pointId, self.pointType)
+        series = loadParameterSeriesForPoints(url, parameter, [point], asFloat)
+        if not series[point]:
+            raise Exception("No data found for point %s/%s in %s" % (self.pointId, self.pointType, url))
+        return series[point]
 
 
     def getModelCalculationTimestamp(self, forecastDataUrl):
@@ -268,13 +276,15 @@ class MeteoSwissForecast:
         return int(calendar.timegm(datetime.datetime.strptime(run, "%Y%m%d%H%M").timetuple()))
 
 
-    def collectData(self, forecastDataUrl=None, daysToUse=7, timeFormat="%H:%M", dateFormat="%A, %-d. %B", localeAlias="en_US.utf8", showSunshine=False, rainVariance=False):
+    # series: Optional dict of already loaded parameter series (field name -> series), eg. from collectDataForLocations()
+    @forecastMetrics.timed("collectData")
+    def collectData(self, forecastDataUrl=None, daysToUse=7, timeFormat="%H:%M", dateFormat="%A, %-d. %B", localeAlias="en_US.utf8", showSunshine=False, rainVariance=False, series=None):
         run = self._extractRun(forecastDataUrl)
         if run is None:
             run = self.getLatestForecastRun()
         else:
             self.latestRun = run
-            if not hasattr(self, 'itemAssets') or not self.itemAssets:
+            if not hasattr(self, 'stacIndex') or not self.stacIndex:
                 self.getLatestForecastRun()
 
         logging.debug("%r, %r" % (daysToUse, maximumNumberOfDays))
@@ -282,59 +292,40 @@ class MeteoSwissForecast:
             daysToUse = maximumNumberOfDays
             logging.warning("Limiting days to be shown to %d days!" % maximumNumberOfDays)
 
-        parameterConfig = [
-            ('temperature', 'tre200h0', True),
-            ('temperatureVarianceMin', 'treq10h0', True),
-            ('temperatureVarianceMax', 'treq90h0', True),
-            ('rainfall', 'rre150h0', True),
-            ('rainfallVarianceMax', 'rreq90h0', True),
-            ('wind', 'fu3010h0', True),
-            ('symbols', 'jww003i0', False),
-        ]
-
-        if rainVariance:
-            parameterConfig.append(('rainfallVarianceMin', 'rreq10h0', True))
-        if showSunshine:
-            parameterConfig.append(('sunshine', 'sre000h0', False))
-
-        series = {}
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = {
-                executor.submit(self.loadParameterSeries, self.getParameterAssetUrl(parameter, run), parameter, asFloat): field
-                for field, parameter, asFloat in parameterConfig
-            }
-            for future in concurrent.futures.as_completed(futures):
-                field = futures[future]
-                series[field] = future.result()
-
-        symbolsSeries = series['symbols']
+        if series is None:
+            series = {}
+            loadSeries = forecastMetrics.inCurrentSpan(self.loadParameterSeries) # the downloads get timed as part of this call
+            with concurrent.futures.ThreadPoolExecutor(max_workers=maxConcurrentDownloads) as executor:
+                futures = {
+                    executor.submit(loadSeries, self.getParameterAssetUrl(parameter, run), parameter, asFloat): field
+                    for field, parameter, asFloat in getParameterConfig(showSunshine, rainVariance)
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    field = futures[future]
+                    series[field] = future.result()
 
         # Use the temperature time series as the reference time line
         allDates = sorted(series['temperature'].keys())
         if not allDates:
             raise Exception("No forecast data available for point %s" % self.pointId)
 
+        # The CSV Date is the end of the hour, so the display time is one hour earlier
+        displayTimestamps = _datesToTimestamps(allDates) + (self.utcOffset * 3600 - 3600)
+
         # Prefer to start on a 00:00 local-time full-day boundary
-        # (the CSV Date is the end of the hour, so the display time is one hour earlier)
-        startIndex = 0
-        for i, date in enumerate(allDates):
-            utcTs = self._parseDate(date)
-            localTs = utcTs + self.utcOffset * 3600
-            displayTs = localTs - 3600
-            if displayTs % 86400 == 0:
-                startIndex = i
-                break
-
-        availableDates = allDates[startIndex:]
-        fullDays = max(1, len(availableDates) // 24)
+        midnights = np.flatnonzero(displayTimestamps % 86400 == 0)
+        startIndex = int(midnights[0]) if len(midnights) else 0
+
+        availableCount = len(allDates) - startIndex
+        fullDays = max(1, availableCount // 24)
         self.days = min(daysToUse, fullDays, maximumNumberOfDays)
         logging.debug("The forecast contains data for %d days" % self.days)
 
         wantedCount = self.days * 24
-        if self.days < maximumNumberOfDays and len(availableDates) > wantedCount:
+        if self.days < maximumNumberOfDays and availableCount > wantedCount:
             wantedCount += 1
-        selectedDates = availableDates[:wantedCount]
-        if not selectedDates:
+        selected = slice(startIndex, startIndex + wantedCount)
+        if startIndex >= len(allDates):
             raise Exception("No forecast data available for the requested days")
 
         self.data["modelCalculationTimestamp"] = self.getModelCalculationTimestamp(forecastDataUrl if forecastDataUrl else run)
@@ -344,57 +335,32 @@ class MeteoSwissForecast:
         except Exception as e:
             logging.warning("Unable to uses locale \"%s\": %s" % (localeAlias, e))
 
-        dayNames = []
-        formatedTime = []
-        timestamps = []
-        dayTimestamps = {}
-        for date in selectedDates:
-            utcTs = self._parseDate(date)
-            localTs = utcTs + self.utcOffset * 3600
-            displayTs = localTs - 3600
-            dayTimestamps[date] = displayTs
-            timestamps.append(displayTs)
-            formatedTime.append(datetime.datetime.fromtimestamp(displayTs, datetime.UTC).strftime(timeFormat))
-
-        for day in range(0, self.days):
-            dayNames.append(datetime.datetime.fromtimestamp(timestamps[day * 24], datetime.UTC).strftime(dateFormat))
-
-        rainfall = [series['rainfall'].get(d) for d in selectedDates]
-        temperature = [series['temperature'].get(d) for d in selectedDates]
-        rainfallVarianceMin = [series['rainfallVarianceMin'].get(d) for d in selectedDates] if rainVariance else [None] * len(selectedDates)
-        rainfallVarianceMax = [series['rainfallVarianceMax'].get(d) for d in selectedDates]
-        temperatureVarianceMin = [series['temperatureVarianceMin'].get(d) for d in selectedDates]
-        temperatureVarianceMax = [series['temperatureVarianceMax'].get(d) for d in selectedDates]
-        wind = [series['wind'].get(d) for d in selectedDates]
-        sunshine = [series['sunshine'].get(d) for d in selectedDates] if showSunshine else [None] * len(selectedDates)
-
-        symbols = []
-        symbolsTimestamps = []
-        for day in range(0, self.days):
-            for h in [0, 3, 6, 9, 12, 15, 18, 21]:
-                idx = day * 24 + h
-                if idx >= self.days * 24:
-                    continue
-                date = selectedDates[idx]
-                value = symbolsSeries.get(date)
-                if value is not None:
-                    symbols.append(value)
-                    symbolsTimestamps.append(dayTimestamps[date])
+        timestamps = displayTimestamps[selected]
+        formatedTime = [datetime.datetime.fromtimestamp(ts, datetime.UTC).strftime(timeFormat) for ts in timestamps.tolist()]
+        dayNames = [datetime.datetime.fromtimestamp(ts, datetime.UTC).strftime(dateFormat) for ts in timestamps[:self.days * 24:24].tolist()]
+
+        # All series as arrays on the time axis, missing values are NaN
+        values = {field: _alignSeries(fieldSeries, allDates)[selected] for field, fieldSeries in series.items()}
+        noValues = np.full(len(timestamps), np.nan)
+
+        # Symbols are shown every 3 hours
+        symbolIndexes = np.arange(0, self.days * 24, 3)
+        symbolIndexes = symbolIndexes[~np.isnan(values['symbols'][symbolIndexes])]
 
         self.data["noOfDays"] = self.days
         self.data["dayNames"] = dayNames
-        self.data["timestamps"] = timestamps
+        self.data["timestamps"] = timestamps.tolist()
         self.data["formatedTime"] = formatedTime
-        self.data["rainfall"] = rainfall
-        self.data["rainfallVarianceMin"] = rainfallVarianceMin
-        self.data["rainfallVarianceMax"] = rainfallVarianceMax
-        self.data["temperature"] = temperature
-        self.data["temperatureVarianceMin"] = temperatureVarianceMin
-        self.data["temperatureVarianceMax"] = temperatureVarianceMax
-        self.data["wind"] = wind
-        self.data["sunshine"] = sunshine
-        self.data["symbols"] = symbols
-        self.data["symbolsTimestamps"] = symbolsTimestamps
+        self.data["rainfall"] = values['rainfall'].tolist()
+        self.data["rainfallVarianceMin"] = values['rainfallVarianceMin'].tolist() if rainVariance else noValues.tolist()
+        self.data["rainfallVarianceMax"] = values['rainfallVarianceMax'].tolist()
+        self.data["temperature"] = values['temperature'].tolist()
+        self.data["temperatureVarianceMin"] = values['temperatureVarianceMin'].tolist()
+        self.data["temperatureVarianceMax"] = values['temperatureVarianceMax'].tolist()
+        self.data["wind"] = values['wind'].tolist()
+        self.data["sunshine"] = _integerList(values['sunshine']) if showSunshine else noValues.tolist()
+        self.data["symbols"] = _integerList(values['symbols'][symbolIndexes])
+        self.data["symbolsTimestamps"] = timestamps[symbolIndexes].tolist()
 
         # Testing
         #self.data["temperature"][-1] = -1
@@ -404,20 +370,23 @@ class MeteoSwissForecast:
         #except:
             #pass
 
-        # Sometimes the data contains None for some fields
-        # We replace it by NaN
-        for key, data in self.data.items():
-            try:
-                if key != "forecastDataUrl":
-                    self.data[key] =  [np.nan if v is None else v for v in self.data[key]]
-            except:
-                pass
-
         logging.debug("All data parsed")
 
         return self.data
 
 
+    """
+    asyncio variant of collectData(), see collectDataForLocationsAsync()
+    """
+    async def collectDataAsync(self, forecastDataUrl=None, daysToUse=7, timeFormat="%H:%M", dateFormat="%A, %-d. %B", localeAlias="en_US.utf8", showSunshine=False, rainVariance=False):
+        run, points = await asyncio.to_thread(_prepareLocations, [self], forecastDataUrl)
+        seriesByField = await _loadSeriesAsync(self, run, points, getParameterConfig(showSunshine, rainVariance))
+        series = {field: seriesByPoint[points[0]] for field, seriesByPoint in seriesByField.items()}
+        if not series['temperature']:
+            raise Exception("No data found for point %s/%s" % points[0])
+        return await asyncio.to_thread(self.collectData, forecastDataUrl=forecastDataUrl if forecastDataUrl else run, daysToUse=daysToUse, timeFormat=timeFormat, dateFormat=dateFormat, localeAlias=localeAlias, showSunshine=showSunshine, rainVariance=rainVariance, series=series)
+
+
     """
     Extracts the data when it is normal structured
     """
@@ -514,6 +483,7 @@ class MeteoSwissForecast:
     """
     Exports a JSON file containing the forecast data ( as generated with the collectData() function) 
     """
+    @forecastMetrics.timed("exportForecastData")
     def exportForecastData(self, forecastData, outputFilename):
         with open(outputFilename, 'w') as outfile:
             json.dump(forecastData, outfile, indent=2)
@@ -554,406 +524,304 @@ class MeteoSwissForecast:
 
 
     """
-    Generates the graphic containing the forecast
+    Generates the graphic containing the forecast and returns its meta data, see forecastGraph.generateGraph()
     """
-    def generateGraph(self, data=None, outputFilename=None, timeDivisions=6, graphWidth=1920, graphHeight=300, darkMode=False, rainVariance=False, minMaxTemperature=False, fontSize=12, symbolZoom=1.0, symbolDivision=1, showCityName=False, hideDataCopyright=False, writeMetaData=None, progressCallback=None, measuredRain=None, measuredTemperature=None, showSunshine=False, sunshineBars=False):
-        if progressCallback:
-            progressCallback("0%")
-
-        logging.debug("Initializing graph...")
-        if darkMode:
-            colors = self.colorsDarkMode
+    def generateGraph(self, *args, **kwargs):
+        import forecastGraph # matplotlib only gets loaded once a graph gets rendered
+        return forecastGraph.generateGraph(self, *args, **kwargs)
+
+
+# Returns the parameters to be loaded as list of (field name, parameter, is float)
+def getParameterConfig(showSunshine=False, rainVariance=False):
+    parameterConfig = [
+        ('temperature', 'tre200h0', True),
+        ('temperatureVarianceMin', 'treq10h0', True),
+        ('temperatureVarianceMax', 'treq90h0', True),
+        ('rainfall', 'rre150h0', True),
+        ('rainfallVarianceMax', 'rreq90h0', True),
+        ('wind', 'fu3010h0', True),
+        ('symbols', 'jww003i0', False),
+    ]
+
+    if rainVariance:
+        parameterConfig.append(('rainfallVarianceMin', 'rreq10h0', True))
+    if showSunshine:
+        parameterConfig.append(('sunshine', 'sre000h0', False))
+    return parameterConfig
+
+
+"""
+Returns the index of the point metadata (see pointIndex.PointIndex).
+The index gets built once per metadata version and is persisted in the cache directory,
+so it can be reused by other processes as long as the metadata did not change.
+It gets loaded by one thread at a time, without blocking the threads which can still use the previous index.
+"""
+def getPointIndex():
+    url = MeteoSwissForecast.pointMetaUrl
+    with _pointIndexLock:
+        cached = _pointIndexes.get(url)
+        loadLock = _pointIndexLoadLocks.setdefault(url, threading.Lock())
+    if cached and time.time() - cached[1] < pointIndexMaxAge:
+        return cached[0]
+
+    # Only one thread loads the index, while the others keep using the previous one if there is one
+    if not loadLock.acquire(blocking=cached is None):
+        return cached[0]
+    try:
+        with _pointIndexLock:
+            cached = _pointIndexes.get(url)
+        if cached and time.time() - cached[1] < pointIndexMaxAge:
+            return cached[0] # loaded by another thread meanwhile
+        index = _loadPointIndex(url)
+        with _pointIndexLock:
+            _pointIndexes[url] = (index, time.time())
+        return index
+    finally:
+        loadLock.release()
+
+
+def _loadPointIndex(url):
+    with forecastMetrics.span("metadataLookup"):
+        logging.debug("Loading point metadata from %r..." % url)
+        index = None
+        meta, bodyFile = (None, None)
+        if _httpCache:
+            with forecastMetrics.span("download", file=os.path.basename(url)):
+                try:
+                    meta, bodyFile = _httpCache.getFile(url)
+                except Exception as e:
+                    raise Exception("Failed to fetch URL (%r): %r" % (url, e))
+                if bodyFile:
+                    forecastMetrics.annotate(bytes=os.path.getsize(bodyFile))
+
+        if bodyFile:
+            version = meta.get('etag') or meta.get('lastModified')
+            if not version:
+                with open(bodyFile, 'rb') as f:
+                    version = hashlib.sha1(f.read()).hexdigest()
+            version = url + " " + version
+            indexFile = os.path.join(_httpCache.directory, "point-index-%s.json" % hashlib.sha1(url.encode('utf-8')).hexdigest())
+            index = pointIndex.PointIndex.load(indexFile, version)
+            forecastMetrics.annotate(index="loaded" if index else "built")
+            if index is None:
+                with open(bodyFile, encoding='latin1', newline='') as handle:
+                    index = pointIndex.PointIndex.build(handle, version)
+                try:
+                    index.save(indexFile)
+                except OSError as e:
+                    logging.warning("Failed to save the point index: %s" % e)
         else:
-            colors = self.colorsLightMode
-
-        fig = plt.figure(0) # Main figure
-        rainAxis = fig.add_subplot(111)
-
-        # set font sizes
-        plt.rcParams.update({'font.size': fontSize}) # Temperature Y axis and day names
-        rainAxis.tick_params(axis='y', labelsize=fontSize) # Rain Y axis
-        plt.xticks(fontsize=fontSize) # Time axis
-
-
-        if not graphWidth:
-            graphWidth = 1280
-        if not graphHeight:
-            graphHeight = 300
-        logging.debug("Graph size: %d x %d pixel" % (graphWidth, graphHeight))
-        fig.set_size_inches(float(graphWidth)/fig.get_dpi(), float(graphHeight)/fig.get_dpi())
-
-
-        # Plot dimension and borders
-        bbox = rainAxis.get_window_extent().transformed(fig.dpi_scale_trans.inverted())
-        width, height = bbox.width * fig.dpi, bbox.height * fig.dpi # plot size in pixel
-
-        plt.margins(x=0)
-        rainAxis.margins(x=0)
-
-        plt.subplots_adjust(left=40/width, right=1-40/width, top=1-35/height, bottom=40/height)
-
-        bbox = rainAxis.get_window_extent().transformed(fig.dpi_scale_trans.inverted())
-        width, height = bbox.width * fig.dpi, bbox.height * fig.dpi # plot size in pixel
-        xPixelsPerDay = width / data["noOfDays"]
-        
-        # Dimensions of the axis in pixel
-        firstDayX = math.ceil(bbox.x0 * fig.dpi)
-        firstDayY = math.ceil(bbox.y0 * fig.dpi)
-        dayWidth = math.floor((bbox.x1 - bbox.x0) * fig.dpi) / data["noOfDays"]
-        dayHeight = math.floor((bbox.y1 - bbox.y0) * fig.dpi)   
-
-        # Show gray background on every 2nd day
-        for day in range(0, data["noOfDays"], 2):
-            plt.axvspan(data["timestamps"][0 + day * 24], data["timestamps"][23 + day * 24] + 3600, facecolor='gray', alpha=0.2)
-
-
-        # Time axis and ticks
-        plt.xticks(data["timestamps"][::timeDivisions], data["formatedTime"][::timeDivisions])
-        rainAxis.tick_params(axis='x', colors=colors["x-axis"])
-
-        # Rain (data gets splitted to stacked bars)
-        logging.debug("Creating rain plot...")
-        rainBars = [0] * len(self.rainColorSteps)
-
-        for i in range(0, len(self.rainColorSteps)):
-            rainBars[i] = []
-
-        if progressCallback:
-            progressCallback("20%")
-
-        for rain in data["rainfall"]:
-            for i in range(0, len(self.rainColorSteps)):
-                if rain > self.rainColorSteps[i]:
-                    rainBars[i].append(self.rainColorStepSizes[i])
-                else:
-                    if i > 0:
-                        rainBars[i].append(max(rain - self.rainColorSteps[i-1], 0))
-                    else:
-                        rainBars[i].append(rain)
-                    continue
-
-        rainAxis.tick_params(axis='y', labelcolor=colors["rain-axis"], width=0, length=8)
-        rainYRange = plt.ylim()
-        rainScaleMax = max(data["rainfall"]) + 1 # Add a bit to make sure we do not bang our head
-
-        # Sunshine visualization (drawn before rain to be behind)
-        if showSunshine and "sunshine" in data:
-            maxSunshineHeight = 0.99 * rainScaleMax
-            sunshineHeight = [min(s / 60.0, 0.99) * maxSunshineHeight for s in data["sunshine"]]
-            if sunshineBars:
-                sunshinePatches = [Rectangle((t, 0), 3000, h, facecolor='#e8b400', edgecolor='none') for t, h in zip(data["timestamps"], sunshineHeight)]
-                rainAxis.add_collection(PatchCollection(sunshinePatches, match_original=True, zorder=1))
-            else:
-                # Center the sunshine line/fill on each hour
-                lineTimestamps = [t + 1800 for t in data["timestamps"]]
-                # Create smooth spline interpolation
-                timestamps = np.array(lineTimestamps)
-                sunshine = np.array(sunshineHeight)
-                # Use spline interpolation for smooth curve
-                spline = interpolate.make_interp_spline(timestamps, sunshine, k=3)
-                smooth_timestamps = np.linspace(timestamps.min(), timestamps.max(), 100)
-                smooth_sunshine = spline(smooth_timestamps)
-                # Clamp to maximum height to prevent spline overshoot
-                smooth_sunshine = np.clip(smooth_sunshine, 0, maxSunshineHeight)
-                rainAxis.fill_between(smooth_timestamps, 0, smooth_sunshine, color='#fff3b0', alpha=0.5, zorder=1)
-                rainAxis.plot(smooth_timestamps, smooth_sunshine, color='#e8b400', linewidth=2, zorder=2)
-
-        rainPatches = []
-        bottom = [0] * len(rainBars[0])
-        for i in range(0, len(self.rainColorSteps)):
-            for t, h, b in zip(data["timestamps"], rainBars[i], bottom):
-                if h > 0:
-                    rainPatches.append(Rectangle((t, b), 3000, h, facecolor=self.rainColors[i], edgecolor='none'))
-            if i < len(self.rainColorSteps) - 1:
-                bottom = [b + h for b, h in zip(bottom, rainBars[i])]
-        if rainPatches:
-            rainAxis.add_collection(PatchCollection(rainPatches, match_original=True, zorder=3))
-
-        if measuredRain:
-            measRainTime, measRain = measuredRain
-            measRainTime = [t + self.utcOffset * 3600 for t in measRainTime]
-            rainScaleMax = max(rainScaleMax, max(measRain) + 1)
-
-
-        plt.ylim(0, rainScaleMax)
-        rainAxis.locator_params(axis='y', nbins=7)
-        # TODO find a better way than rounding 
-        rainAxis.yaxis.set_major_formatter(FormatStrFormatter('%0.1f'))
-
-        # Rain color bar as y axis
-        plt.xlim(data["timestamps"][0], data["timestamps"][-2] + (data["timestamps"][1] - data["timestamps"][0]))
-        pixelToRainX = 1 / xPixelsPerDay * (data["timestamps"][23] - data["timestamps"][0])
-        x = data["timestamps"][-2] + (data["timestamps"][1] - data["timestamps"][0]) # end of x
-        w = 7 * pixelToRainX
-
-        for i in range(0, len(self.rainColorSteps)):
-            y = self.rainColorSteps[i] - self.rainColorStepSizes[i]
-            if y > rainScaleMax:
-                break
-            h = self.rainColorSteps[i] + self.rainColorStepSizes[i]
-            if y + h >= rainScaleMax: # reached top
-                h = rainScaleMax - y
-            rainScaleBar = Rectangle((x, y), w, h, fc=self.rainColors[i], alpha=1)
-            rainAxis.add_patch(rainScaleBar)
-            rainScaleBar.set_clip_on(False)
-
-        rainScaleBorder = Rectangle((x, 0), w, rainScaleMax, fc="black", fill=False, alpha=1)
-        rainAxis.add_patch(rainScaleBorder)
-        rainScaleBorder.set_clip_on(False)
-
-        # Rain variance
-        if rainVariance:
-            rainfallVarianceAxis = rainAxis.twinx()  # instantiate a second axes that shares the same x-axis
-            rainfallVarianceAxis.axes.yaxis.set_visible(False)
-
-            timestampsCentered = [i + 1500 for i in data["timestamps"]]
-            # Use original variance data directly
-            rainfallVarianceMin = data["rainfallVarianceMin"]
-            rainfallVarianceMax = data["rainfallVarianceMax"]
-
-            # Calculate variance ranges for errorbar
-            errorbarMin = np.subtract(np.array(data["rainfall"]), np.array(rainfallVarianceMin))
-            errorbarMin = [max(0, x) for x in errorbarMin]
-            errorbarMax = np.subtract(np.array(rainfallVarianceMax), np.array(data["rainfall"]))
-            errorbarMax = [max(0, x) for x in errorbarMax]
-
-            # rainfallVarianceAxis.errorbar(timestampsCentered, data["rainfall"], yerr=[errorbarMin, errorbarMax],
-                    # fmt="none", elinewidth=1, alpha=0.5, ecolor='darkgray', capsize=3)
-            # Add variance bar starting from rainfallVarianceMin to rainfallVarianceMax
-            varianceRange = np.subtract(rainfallVarianceMax, rainfallVarianceMin)
-            rainfallVarianceAxis.bar(timestampsCentered, varianceRange, 
-                    bottom=rainfallVarianceMin, width=3000, fill=False, edgecolor='darkgray', linewidth=1, alpha=0.5, zorder=4)
-            plt.ylim(0, rainScaleMax)
-
-
-        # Show when the model was last calculated
-        # The model run time is an end-of-hour timestamp, so shift it back by one hour
-        # to align with the start-of-hour display convention used for the forecast data.
-        timestampLocal = data["modelCalculationTimestamp"] + self.utcOffset * 3600 - 3600
-        #l = mlines.Line2D([timestampLocal, timestampLocal], [rainYRange[0], rainScaleMax])
-        #rainAxis.add_line(l)
-        #rainAxis.plot([timestampLocal], [(rainScaleMax-rainYRange[0])/40], '^', color='blue', linewidth=2)
-        rainAxis.plot([timestampLocal], [rainScaleMax* 0.97], 'v', color='green', markersize=10)
-
-
-        if progressCallback:
-            progressCallback("40%")
-
-        # Temperature
-        logging.debug("Creating temperature plot...")
-        temperatureAxis = rainAxis.twinx()  # instantiate a second axes that shares the same x-axis
-        temperatureAxis.plot(data["timestamps"], data["temperature"], label = "temperature", color=self.temperatureColor, linewidth=4)
-        #temperatureAxis.set_ylabel('Temperature', color=self.temperatureColor)
-        temperatureAxis.tick_params(axis='y', labelcolor=colors["temperature-axis"])
-        temperatureAxis.grid(True)
-
-
-        # Position the Y Scales
-        temperatureAxis.yaxis.tick_left()
-        rainAxis.yaxis.tick_right()
-
-
-        # Make sure the temperature scaling has a gap of 45 pixel, so we can fit the labels
-        interimPixelToTemperature = (np.nanmax(data["temperature"]) - np.nanmin(data["temperature"])) / height
-        extraYScaleGap = float(45) * interimPixelToTemperature
-        temperatureScaleMin = np.nanmin(data["temperature"]) - extraYScaleGap
-        temperatureScaleMax = np.nanmax(data["temperature"]) + extraYScaleGap
-
-
-        if measuredTemperature:
-            measTempTime, measTemperature = measuredTemperature
-            measTempTime = [t + self.utcOffset * 3600 for t in measTempTime]
-            temperatureScaleMin = min(temperatureScaleMin, min(measTemperature) - extraYScaleGap)
-            temperatureScaleMax = max(temperatureScaleMax, max(measTemperature) + extraYScaleGap)
-
-
-        plt.ylim(temperatureScaleMin, temperatureScaleMax)
-        temperatureAxis.locator_params(axis='y', nbins=6)
-        temperatureAxis.yaxis.set_major_formatter(FormatStrFormatter('%0.1f'))
-        pixelToTemperature = (temperatureScaleMax - temperatureScaleMin) / height
-
-
-        # Temperature variance
-        temperatureVarianceAxis = temperatureAxis.twinx()  # instantiate a second axes that shares the same x-axis
-        temperatureVarianceAxis.axes.yaxis.set_visible(False)
-
-        temperatureVarianceAxis.fill_between(data["timestamps"], data["temperatureVarianceMin"], data["temperatureVarianceMax"], facecolor=self.temperatureColor, alpha=0.2)
-        temperatureVarianceAxis.tick_params(axis='y', labelcolor=self.temperatureColor)
-        plt.ylim(temperatureScaleMin, temperatureScaleMax)
-
-
-        if measuredRain:
-            logging.debug("Measured rain data got provided, adding it to plot...") 
-            #rainAxis.step(measRainTime, measRain, where='post', alpha=0.4, color='red') # Histogram curve
-            rainAxis.fill_between(measRainTime, measRain, alpha=0.8, step="post", zorder=2) # Histogram infill
-
-        if measuredTemperature:
-            logging.debug("Measured temperature data got provided, adding it to plot...")
-            temperatureVarianceAxis.plot(measTempTime, measTemperature, linewidth=4, color='coral', zorder=2)
-
-
-        logging.debug("Adding various additional information to the graph...")
-
-        if progressCallback:
-            progressCallback("60%")
-
-        # Find min/max for each day
-        maxTemperatureOfDay = [None] * data["noOfDays"]
-        minTemperatureOfDay = [None] * data["noOfDays"]
-        if minMaxTemperature:
-            da = DrawingArea(2, 2, 0, 0)
-            da.add_artist(Circle((1, 1), 4, color=self.temperatureColor, fc="white", lw=2))
-            for day in range(0, data["noOfDays"]):
-                maxTemperatureOfDay[day] = {"data": -100, "timestamp": 0}
-                minTemperatureOfDay[day] = {"data": +100, "timestamp": 0}
-                for h in range(0, 24):
-                    timestampOfHour = data["timestamps"][day * 24 + h]
-                    temperatureOfHour = data["temperature"][day * 24 + h]
-                    if temperatureOfHour > maxTemperatureOfDay[day]["data"]:
-                        maxTemperatureOfDay[day]["data"] = temperatureOfHour
-                        maxTemperatureOfDay[day]["timestamp"] = timestampOfHour
-                        maxTemperatureOfDay[day]["xpixel"] = (timestampOfHour - data["timestamps"][0]) / (24*3600) * xPixelsPerDay
-                        maxTemperatureOfDay[day]["ypixel"] = (temperatureOfHour - temperatureScaleMin) / (temperatureScaleMax - temperatureScaleMin) * height
-                    if temperatureOfHour < minTemperatureOfDay[day]["data"]:
-                        minTemperatureOfDay[day]["data"] = temperatureOfHour
-                        minTemperatureOfDay[day]["timestamp"] = timestampOfHour
-                        minTemperatureOfDay[day]["xpixel"] = (timestampOfHour - data["timestamps"][0]) / (24*3600) * xPixelsPerDay
-                        minTemperatureOfDay[day]["ypixel"] = (temperatureOfHour - temperatureScaleMin) / (temperatureScaleMax - temperatureScaleMin) * height
-
-                if day < maximumNumberOfDays-1: # We can also add the first hour of the next day (except on the last day)
-                    timestampOfHour = data["timestamps"][(day + 1) * 24]
-                    temperatureOfHour = data["temperature"][(day + 1) * 24]
-                    if temperatureOfHour > maxTemperatureOfDay[day]["data"]:
-                        maxTemperatureOfDay[day]["data"] = temperatureOfHour
-                        maxTemperatureOfDay[day]["timestamp"] = timestampOfHour
-                        maxTemperatureOfDay[day]["xpixel"] = (timestampOfHour - data["timestamps"][0]) / (24*3600) * xPixelsPerDay
-                        maxTemperatureOfDay[day]["ypixel"] = (temperatureOfHour - temperatureScaleMin) / (temperatureScaleMax - temperatureScaleMin) * height
-                    if temperatureOfHour < minTemperatureOfDay[day]["data"]:
-                        minTemperatureOfDay[day]["data"] = temperatureOfHour
-                        minTemperatureOfDay[day]["timestamp"] = timestampOfHour
-                        minTemperatureOfDay[day]["xpixel"] = (timestampOfHour - data["timestamps"][0]) / (24*3600) * xPixelsPerDay
-                        minTemperatureOfDay[day]["ypixel"] = (temperatureOfHour - temperatureScaleMin) / (temperatureScaleMax - temperatureScaleMin) * height
-
-
-            # Mark min/max temperature per day
-            for day in range(0, data["noOfDays"]):
-                dayXPixelMin = day * xPixelsPerDay
-                dayXPixelMax = (day + 1) * xPixelsPerDay - 1
-
-                if day == data["noOfDays"]-1 or maxTemperatureOfDay[day]["xpixel"] != maxTemperatureOfDay[day+1]["xpixel"]: # Prevent multiple circles/lables for same spot (00:00/24:00)
-                    # Max Temperature Circles
-                    temperatureVarianceAxis.add_artist(AnnotationBbox(da, (maxTemperatureOfDay[day]["timestamp"], maxTemperatureOfDay[day]["data"]), xybox=(maxTemperatureOfDay[day]["timestamp"], maxTemperatureOfDay[day]["data"]), xycoords='data', boxcoords=("data", "data"), frameon=False))
-
-                    # Max Temperature Labels
-                    text = str(int(round(maxTemperatureOfDay[day]["data"], 0))) + "°C"
-                    f = plt.figure(1) # Temporary figure to get the dimensions of the text label
-                    t = plt.text(0, 0, text, weight='bold')
-                    temporaryLabel = t.get_window_extent(renderer=f.canvas.get_renderer())
-                    plt.figure(0) # Select Main figure again
-
-                    # Check if text is fully within the day (x axis)
-                    if maxTemperatureOfDay[day]["xpixel"] - temporaryLabel.width / 2 < dayXPixelMin: # To far left
-                        maxTemperatureOfDay[day]["xpixel"] = dayXPixelMin + temporaryLabel.width / 2 + self.textShadowWidth / 2
-                    if maxTemperatureOfDay[day]["xpixel"] + temporaryLabel.width / 2 > dayXPixelMax: # To far right
-                        maxTemperatureOfDay[day]["xpixel"] = dayXPixelMax - temporaryLabel.width / 2 - self.textShadowWidth / 2
-
-                    temperatureVarianceAxis.annotate(text, xycoords=('axes pixels'), xy=(maxTemperatureOfDay[day]["xpixel"], maxTemperatureOfDay[day]["ypixel"] + 8),
-                                                    ha="center", va="bottom", color=colors["temperature-label"], weight='bold',
-                                                    path_effects=[path_effects.withStroke(linewidth=self.textShadowWidth, foreground="w")])
-
-                if day == data["noOfDays"]-1 or minTemperatureOfDay[day]["xpixel"] != minTemperatureOfDay[day+1]["xpixel"]: # Prevent multiple circles/lables for same spot (00:00/24:00)
-                    # Min Temperature Circles
-                    temperatureVarianceAxis.add_artist(AnnotationBbox(da, (minTemperatureOfDay[day]["timestamp"], minTemperatureOfDay[day]["data"]), xybox=(minTemperatureOfDay[day]["timestamp"], minTemperatureOfDay[day]["data"]), xycoords='data', boxcoords=("data", "data"), frameon=False))
-
-                    # Min Temperature Labels
-                    text = str(int(round(minTemperatureOfDay[day]["data"], 0))) + "°C"
-                    f = plt.figure(1) # Temporary figure to get the dimensions of the text label
-                    t = plt.text(0, 0, text, weight='bold')
-                    temporaryLabel = t.get_window_extent(renderer=f.canvas.get_renderer())
-                    plt.figure(0) # Select Main figure again
-
-                    # Check if text is fully within the day (x axis)
-                    if minTemperatureOfDay[day]["xpixel"] - temporaryLabel.width / 2 < dayXPixelMin: # To far left
-                        minTemperatureOfDay[day]["xpixel"] = dayXPixelMin + temporaryLabel.width / 2 + self.textShadowWidth / 2
-                    if minTemperatureOfDay[day]["xpixel"] + temporaryLabel.width / 2 > dayXPixelMax: # To far right
-                        minTemperatureOfDay[day]["xpixel"] = dayXPixelMax - temporaryLabel.width / 2 - self.textShadowWidth / 2
-
-                    temperatureVarianceAxis.annotate(text, xycoords=('axes pixels'), xy=(minTemperatureOfDay[day]["xpixel"], minTemperatureOfDay[day]["ypixel"] - 12),
-                                                    ha="center", va="top", color=colors["temperature-label"], weight='bold',
-                                                    path_effects=[path_effects.withStroke(linewidth=self.textShadowWidth, foreground="w")])
-
-        if progressCallback:
-            progressCallback("80%")
-
-        # Print day names
-        for day in range(0, data["noOfDays"]):
-            rainAxis.annotate(data['dayNames'][day], xy=(day * xPixelsPerDay + xPixelsPerDay / 2, -45), xycoords='axes pixels', ha="center", weight='bold', color=colors["x-axis"])
-
-
-        # Show y-axis units
-        rainAxis.annotate("mm\n/h", linespacing = 0.8, xy=(width + 25, height + 12), xycoords='axes pixels', ha="center", color=colors["rain-axis"])
-        rainAxis.annotate("°C", xy=(-20, height + 10), xycoords='axes pixels', ha="center", color=colors["temperature-axis"])
-
-
-        # Show Symbols above the graph
-        for i in range(0, len(data["symbols"]), symbolDivision):
-            symbolFile = os.path.dirname(os.path.realpath(__file__)) + "/symbols/" + str(data["symbols"][i]) + ".png"
-            if not os.path.isfile(symbolFile):
-                logging.warning("The symbol file %s seems to be missing. Please check the README.md!" % symbolFile)
+            handle = io.TextIOWrapper(io.BytesIO(_download(url)), encoding='latin1', newline='')
+            with handle:
+                index = pointIndex.PointIndex.build(handle, None)
+
+        return index
+
+
+"""
+Returns the parsed asset index of the STAC items (see stacIndex.StacIndex).
+The index is shared by all instances and only gets rebuilt when the response changed.
+"""
+def getStacIndex():
+    url = MeteoSwissForecast.stacCollectionUrl + "/items"
+    logging.debug("Loading STAC items from %r..." % url)
+    with forecastMetrics.span("stacDiscovery"):
+        content = _download(url)
+        version = hashlib.sha1(content).hexdigest()
+        with _stacIndexLock:
+            if url in _stacIndexes and _stacIndexes[url][0] == version:
+                return _stacIndexes[url][1]
+        index = stacIndex.StacIndex(json.loads(content.decode('utf-8')), MeteoSwissForecast.requiredParameters)
+        forecastMetrics.annotate(runs=len(index.runs))
+        with _stacIndexLock:
+            _stacIndexes[url] = (version, index)
+        return index
+
+
+"""
+Looks up the locations of the given zip codes in the point metadata index.
+Returns a dict of zip code -> (point id, point type, city name), unknown zip codes are missing.
+"""
+def findPoints(zipCodes):
+    index = getPointIndex()
+    points = {}
+    for zipCode in zipCodes:
+        point = index.lookupZipCode(zipCode)
+        if point:
+            points[zipCode] = point
+    return points
+
+
+"""
+Loads a parameter CSV and returns the series (date -> value) for each of the given points.
+points: List of (point id, point type), the file gets scanned only once for all of them.
+"""
+def loadParameterSeriesForPoints(url, parameter, points, asFloat=True):
+    with forecastMetrics.span("loadParameter", parameter=parameter, points=len(points)):
+        return _loadParameterSeriesForPoints(url, parameter, points, asFloat)
+
+
+# The download and the parsing of the CSV are streamed, so they are timed together
+def _loadParameterSeriesForPoints(url, parameter, points, asFloat):
+    if _forecastStore and _forecastStore.accepts(url):
+        forecastMetrics.annotate(source="store")
+        table = _forecastStore.getTable(url, parameter, asFloat)
+        return {(pointId, pointType): table.getSeries(pointId, pointType) for pointId, pointType in points}
+
+    logging.debug("Loading %s for %d point(s) from %r..." % (parameter, len(points), url))
+    handle = _openStream(url)
+    try:
+        header = handle.readline().decode('latin1').rstrip('\r\n').split(';')
+        pointIdIdx = header.index('point_id')
+        pointTypeIdx = header.index('point_type_id')
+        dateIdx = header.index('Date')
+        valueIdx = header.index(parameter)
+        parse = float if asFloat else int
+
+        # Series per point id and point type
+        series = {}
+        for pointId, pointType in points:
+            series.setdefault(pointId.encode('latin1'), {})[pointType.encode('latin1')] = {}
+        pointIds = set(series)
+
+        for line in handle:
+            # Reject the rows of all other points before splitting them
+            # (the point_id normally is the first column, so checking the prefix is sufficient)
+            if pointIdIdx == 0 and line[:line.find(b';')] not in pointIds:
+                continue
+            row = line.rstrip(b'\r\n').split(b';')
+            pointSeries = series.get(row[pointIdIdx], {}).get(row[pointTypeIdx])
+            if pointSeries is None:
                 continue
-            symbolImage = mpimg.imread(symbolFile)
-            imagebox = OffsetImage(symbolImage, zoom=symbolZoom / 1.41 * 0.15)
-            xyPos = ((data["symbolsTimestamps"][i] - data["symbolsTimestamps"][0]) / (24*3600) + len(data["symbols"])/24/6/data["noOfDays"]) * xPixelsPerDay, height + 22
-            ab = AnnotationBbox(imagebox, xy=xyPos, xycoords='axes pixels', frameon=False)
-            rainAxis.add_artist(ab)
-
-
-        # Show city name in graph
-        if showCityName:
-            logging.debug("Adding city name to plot...")
-            text = rainAxis.annotate(self.cityName, xy=(width - 5, height - 18), color='gray', ha='right', linespacing = 0.8, xycoords='axes pixels')
-            text.set_path_effects([path_effects.Stroke(linewidth=self.textShadowWidth, foreground='white'), path_effects.Normal()])
-
-        # Show data copyright graph
-        if not hideDataCopyright:
-            logging.debug("Adding data copyright to plot...")
-            text = rainAxis.annotate("Data © by Meteoswiss", xy=(width - 5, 5), color='gray', ha='right', linespacing = 0.8, xycoords='axes pixels')
-            text.set_path_effects([path_effects.Stroke(linewidth=self.textShadowWidth, foreground='white'), path_effects.Normal()])
-
-        if progressCallback:
-            progressCallback("90%")
-
-        # Save the graph in a png image file
-        logging.debug("Saving graph to %s" % outputFilename)
-        plt.savefig(outputFilename, facecolor=colors["background"])
-        plt.close()
-
-        # Write Meta Data
-        if writeMetaData:
-            logging.debug("Saving Meta Data to %s" % writeMetaData)
-            metaData = {}
-            metaData['city'] = self.cityName
-            metaData['imageHeight'] = graphHeight
-            metaData['imageWidth'] = graphWidth
-            metaData['firstDayX'] = firstDayX
-            metaData['firstDayY'] = firstDayY
-            metaData['dayWidth'] = dayWidth
-            metaData['dayHeight'] = dayHeight
-            metaData['modelTimestamp'] = self.data["modelCalculationTimestamp"] # Seconds in UTC
-            metaData['forecastGenerationTimestamp'] = int(datetime.datetime.now().timestamp())
-            with open(writeMetaData, 'w') as metaFile:
-                json.dump(metaData, metaFile)
-
-        if progressCallback:
-            progressCallback("100%")
+            dateStr = row[dateIdx].decode('latin1')
+            value = row[valueIdx]
+            if not dateStr:
+                continue
+            if not value:
+                parsed = None
+            else:
+                try:
+                    parsed = parse(value)
+                except ValueError:
+                    parsed = None
+            pointSeries[dateStr] = parsed
+    finally:
+        forecastMetrics.annotate(source="csv", bytes=httpCache.getBytesRead(handle))
+        handle.close()
+
+    return {(pointId, pointType): series[pointId.encode('latin1')][pointType.encode('latin1')] for pointId, pointType in points}
+
+
+"""
+Creates the forecast objects for multiple zip codes, the point metadata gets loaded only once.
+"""
+def createForecasts(zipCodes, utcOffset=None):
+    points = findPoints(zipCodes)
+    forecasts = []
+    for zipCode in zipCodes:
+        if zipCode not in points:
+            raise Exception("Failed to get City name: Unknown zip code: %d" % zipCode)
+        forecasts.append(MeteoSwissForecast(zipCode=zipCode, utcOffset=utcOffset, point=points[zipCode]))
+    return forecasts
+
+
+"""
+Collects the data for multiple locations (see collectData() for the parameters).
+Every parameter CSV gets downloaded and scanned only once for all locations.
+Returns a dict of zip code -> forecast data, locations which failed get logged and skipped.
+"""
+@forecastMetrics.timed("collectDataForLocations")
+def collectDataForLocations(forecasts, forecastDataUrl=None, daysToUse=7, timeFormat="%H:%M", dateFormat="%A, %-d. %B", localeAlias="en_US.utf8", showSunshine=False, rainVariance=False):
+    run, points = _prepareLocations(forecasts, forecastDataUrl)
+
+    seriesByField = {}
+    loadSeries = forecastMetrics.inCurrentSpan(loadParameterSeriesForPoints) # the downloads get timed as part of this call
+    with concurrent.futures.ThreadPoolExecutor(max_workers=maxConcurrentDownloads) as executor:
+        futures = {
+            executor.submit(loadSeries, forecasts[0].getParameterAssetUrl(parameter, run), parameter, points, asFloat): field
+            for field, parameter, asFloat in getParameterConfig(showSunshine, rainVariance)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            seriesByField[futures[future]] = future.result()
+
+    return _collectLocations(forecasts, forecastDataUrl if forecastDataUrl else run, seriesByField, daysToUse=daysToUse, timeFormat=timeFormat, dateFormat=dateFormat, localeAlias=localeAlias, showSunshine=showSunshine, rainVariance=rainVariance)
+
+
+# Resolves the forecast run once for all locations, returns the run and the list of points
+def _prepareLocations(forecasts, forecastDataUrl):
+    first = forecasts[0]
+    run = first._extractRun(forecastDataUrl)
+    if run is None or not hasattr(first, 'stacIndex'):
+        latestRun = first.getLatestForecastRun()
+        if run is None:
+            run = latestRun
+    for forecast in forecasts[1:]:
+        forecast.stacIndex, forecast.stacItemId, forecast.itemAssets, forecast.latestRun = first.stacIndex, first.stacItemId, first.itemAssets, run
+    return run, list({(forecast.pointId, forecast.pointType) for forecast in forecasts})
+
+
+# Feeds the loaded series (field name -> point -> series) into collectData() of every location
+def _collectLocations(forecasts, forecastDataUrl, seriesByField, **kwargs):
+    forecastData = {}
+    for forecast in forecasts:
+        point = (forecast.pointId, forecast.pointType)
+        series = {field: seriesByPoint[point] for field, seriesByPoint in seriesByField.items()}
+        try:
+            if not series['temperature']:
+                raise Exception("No data found for point %s/%s" % point)
+            forecastData[forecast.zipCode] = forecast.collectData(forecastDataUrl=forecastDataUrl, series=series, **kwargs)
+        except Exception as e:
+            logging.error("Failed to collect the data for zip code %d: %s" % (forecast.zipCode, e))
+    return forecastData
+
+
+"""
+asyncio variant of collectDataForLocations() for long-running services.
+The STAC listing and all parameter CSVs get fetched concurrently (at most maxConcurrentDownloads at once),
+every parameter gets parsed while it is streamed, so the early ones are done while the late ones still download.
+The limit applies to all concurrent calls in the same event loop, the CPU-bound collecting of the data runs in a thread.
+"""
+async def collectDataForLocationsAsync(forecasts, forecastDataUrl=None, daysToUse=7, timeFormat="%H:%M", dateFormat="%A, %-d. %B", localeAlias="en_US.utf8", showSunshine=False, rainVariance=False):
+    run, points = await asyncio.to_thread(_prepareLocations, forecasts, forecastDataUrl)
+    seriesByField = await _loadSeriesAsync(forecasts[0], run, points, getParameterConfig(showSunshine, rainVariance))
+    return await asyncio.to_thread(_collectLocations, forecasts, forecastDataUrl if forecastDataUrl else run, seriesByField, daysToUse=daysToUse, timeFormat=timeFormat, dateFormat=dateFormat, localeAlias=localeAlias, showSunshine=showSunshine, rainVariance=rainVariance)
+
+
+# Returns the semaphore limiting the downloads of the running event loop
+def _getDownloadSemaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _downloadSemaphores.get(loop)
+    if semaphore is None:
+        semaphore = _downloadSemaphores[loop] = asyncio.Semaphore(maxConcurrentDownloads)
+    return semaphore
+
+
+async def _loadSeriesAsync(forecast, run, points, parameterConfig):
+    semaphore = _getDownloadSemaphore()
+
+    async def load(field, parameter, asFloat):
+        async with semaphore:
+            url = forecast.getParameterAssetUrl(parameter, run)
+            return field, await asyncio.to_thread(loadParameterSeriesForPoints, url, parameter, points, asFloat)
+
+    return dict(await asyncio.gather(*[load(field, parameter, asFloat) for field, parameter, asFloat in parameterConfig]))
+
+
+"""
+asyncio variant of createForecasts(), the point metadata and the STAC listing get fetched concurrently.
+"""
+async def createForecastsAsync(zipCodes, utcOffset=None):
+    await asyncio.gather(asyncio.to_thread(getPointIndex), asyncio.to_thread(getStacIndex))
+    return await asyncio.to_thread(createForecasts, zipCodes, utcOffset)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Script to fetch the MeteoSwiss Weather Forecast data and generate a graph')
     parser.add_argument('-v', action='store_true', help='Verbose output')
-    parser.add_argument('-z', '--zip-code', action='store', type=int, required=True, help='Zip Code of the city to be represented')
-    parser.add_argument('-f', '--file', type=argparse.FileType('w'), required=True, help='File name of the graph to be written (PNG)')
-    parser.add_argument('-m', '--meta', type=argparse.FileType('w'), required=True, help='File name with meta data to be written (JSON)')
+    parser.add_argument('-z', '--zip-code', action='store', type=int, nargs='+', required=True, help='Zip Code of the city to be represented. Multiple zip codes can be given, the data then gets fetched only once for all of them')
+    parser.add_argument('-f', '--file', action='store', required=True, help='File name of the graph to be written (PNG), with --data-only of the forecast data (JSON). When using multiple zip codes, it must contain {zipCode}')
+    parser.add_argument('-m', '--meta', action='store', help='File name with meta data to be written (JSON), not needed with --data-only. When using multiple zip codes, it must contain {zipCode}')
+    parser.add_argument('--data-only', action='store_true', help='Only export the forecast data (JSON) to the file given with --file, without rendering a graph. This does not load the plotting libraries')
     parser.add_argument('--days-to-show', action='store', type=int, default=4, choices=range(1, maximumNumberOfDays+1), help='Number of days to show. If not set, use all data')
     parser.add_argument('--height', action='store', type=int, help='Height of the graph in pixel')
     parser.add_argument('--width', action='store', type=int, help='Width of the graph in pixel', default=1920)
@@ -973,6 +841,19 @@ if __name__ == '__main__':
     parser.add_argument('--export-forecast-data', action='store_true', help='Export fetched forecast data to JSON file')
     parser.add_argument('--show-sunshine', action='store_true', help='Show sunshine in the background')
     parser.add_argument('--sunshine-bars', action='store_true', help='Show sunshine as bars instead of a smooth line/fill')
+    parser.add_argument('--cache-dir', action='store', help='Directory used to cache the downloaded data', default=defaultCacheDirectory)
+    parser.add_argument('--no-cache', action='store_true', help='Do not cache the downloaded data on disk')
+    parser.add_argument('--http-timeout', action='store', type=float, help='Timeout in seconds of the HTTP requests', default=None)
+    parser.add_argument('--image-format', action='store', help='Encoding of the graph, eg. "png:level=9,optimize", "webp", "palette:colors=16" or "rgba" (raw pixels), see imageEncoder.py. Default is PNG', default=None)
+    parser.add_argument('--mark-file', action='store', help='Additionally write the graph with a mark of the current time to this file (see markGraphic.py), directly from the rendered graph. When using multiple zip codes, it must contain {zipCode}')
+    parser.add_argument('--watch', action='store_true', help='Keep running: update the mark of --mark-file every minute and generate the graphs again every --refresh-interval minutes')
+    parser.add_argument('--refresh-interval', action='store', type=int, help='Minutes between the updates of the graphs with --watch', default=60)
+    parser.add_argument('--skip-unchanged', action='store_true', help='Do not render and write the graph again if the graph file and its meta file already show the same forecast data with the same options')
+    parser.add_argument('--variants', action='store', help='JSON file with a list of additional graphs rendered from the same data. Every entry contains generateGraph() arguments which override the options above, eg. [{"outputFilename": "dark-{zipCode}.png", "writeMetaData": "dark-{zipCode}.json", "darkMode": true, "daysToUse": 3}]')
+    parser.add_argument('--processes', action='store', type=int, help='Number of processes rendering the variants, default is the number of CPUs', default=None)
+    parser.add_argument('--symbol-atlas', action='store_true', help='Store the resampled weather symbols as one file in the cache directory, speeds up loading them in further calls')
+    parser.add_argument('--forecast-store', action='store_true', help='Convert the forecast data to memory-mapped tables in the cache directory, speeds up further lookups of the same forecast run')
+    parser.add_argument('--metrics', action='append', help='Report the timing of the stages (downloads, parsing, rendering, encoding, ...) after every update: "log", "json:<file>" (appends one JSON line per update) or "prometheus:<file>" (textfile for the node exporter). Can be given multiple times', default=[])
 
     parser.add_argument('--measurement-data-db-host', action='store', help='DB host providing real local data')
     parser.add_argument('--measurement-data-db-port', action='store', type=int, help='DB port')
@@ -982,6 +863,42 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
+    if not args.data_only and not args.meta:
+        parser.error("the following arguments are required: -m/--meta")
+    if not args.data_only and args.image_format:
+        import imageEncoder
+        try:
+            imageEncoder.parseImageFormat(args.image_format)
+        except Exception as e:
+            parser.error(str(e))
+    if len(args.zip_code) > 1 and any("{zipCode}" not in (fileName or "{zipCode}") for fileName in [args.file, args.meta, args.mark_file]):
+        parser.error("When using multiple zip codes, the file names must contain {zipCode}")
+    if args.data_only and args.mark_file:
+        parser.error("--mark-file needs a graph, it can not be used with --data-only")
+    for description in args.metrics:
+        try:
+            forecastMetrics.addSink(forecastMetrics.createSink(description))
+        except Exception as e:
+            parser.error(str(e))
+
+    variants = []
+    if args.variants:
+        try:
+            with open(args.variants) as f:
+                variants = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error("Failed to read the variants: %s" % e)
+        for variant in variants:
+            if not variant.get('outputFilename'):
+                parser.error("Every variant needs an outputFilename")
+            if len(args.zip_code) > 1 and any("{zipCode}" not in variant.get(name, "{zipCode}") for name in ['outputFilename', 'writeMetaData']):
+                parser.error("When using multiple zip codes, the file names of the variants must contain {zipCode}")
+
+    # The data gets collected once for all variants
+    daysToUse = min(max([args.days_to_show] + [variant.get('daysToUse', 0) for variant in variants]), maximumNumberOfDays)
+    showSunshine = args.show_sunshine or any(variant.get('showSunshine') for variant in variants)
+    rainVariance = args.rain_variance or any(variant.get('rainVariance') for variant in variants)
+
     logLevel = logging.INFO
     if args.v:
         logLevel = logging.DEBUG
@@ -996,30 +913,18 @@ if __name__ == '__main__':
     else:
         utcOffset = getCurrentUtcOffset()
 
-    try:
-        meteoSwissForecast = MeteoSwissForecast(zipCode=args.zip_code, utcOffset=utcOffset)
-    except Exception as e:
-        logging.error("An error occurred: %s" % e)
-        exit(1)
-
-    try:
-        forecastDataUrl = meteoSwissForecast.getForecastDataUrl()
-    except Exception as e:
-        logging.error("An error occurred: %s" % e)
-        exit(1)
+    setCacheDirectory(None if args.no_cache else args.cache_dir)
+    if args.http_timeout:
+        httpCache.configure(connectTimeout=args.http_timeout, readTimeout=args.http_timeout)
+    if args.forecast_store:
+        setForecastStoreDirectory(os.path.join(args.cache_dir, "store"))
 
     try:
-        forecastData = meteoSwissForecast.collectData(forecastDataUrl=forecastDataUrl, daysToUse=args.days_to_show, timeFormat=args.time_format, dateFormat=args.date_format, localeAlias=args.locale, showSunshine=args.show_sunshine, rainVariance=args.rain_variance)
+        forecasts = createForecasts(zipCodes=args.zip_code, utcOffset=utcOffset)
     except Exception as e:
         logging.error("An error occurred: %s" % e)
         exit(1)
 
-    #pprint.pprint(forecastData)
-    if args.export_forecast_data:
-        forecastDataFile = args.file.name.replace(".png", ".json")
-        meteoSwissForecast.exportForecastData(forecastData, forecastDataFile)
-    #forecastData = meteoSwissForecast.importForecastData("./forecast.json")
-
     #if args.measurement_data_db_host != None and args.measurement_data_db_port != None and args.measurement_data_db_user != None and args.measurement_data_db_password != None:  
     #    logging.debug("Using Measurement Data to show real local data")
 #     if True:
@@ -1051,4 +956,127 @@ if __name__ == '__main__':
     measuredRain = None
     measuredTemperature = None
 
-    meteoSwissForecast.generateGraph(data=forecastData, outputFilename=args.file.name, timeDivisions=args.time_divisions, graphWidth=args.width, graphHeight=args.height, darkMode=args.dark_mode, rainVariance=args.rain_variance, minMaxTemperature=args.min_max_temperatures, fontSize=args.font_size, symbolZoom=args.symbol_zoom, symbolDivision=args.symbol_divisions, showCityName=args.city_name, hideDataCopyright=args.hide_data_copyright, writeMetaData=args.meta.name, measuredRain=measuredRain, measuredTemperature=measuredTemperature, showSunshine=args.show_sunshine, sunshineBars=args.sunshine_bars)
+    graphOptions = dict(timeDivisions=args.time_divisions, graphWidth=args.width, graphHeight=args.height, darkMode=args.dark_mode, rainVariance=args.rain_variance, minMaxTemperature=args.min_max_temperatures, fontSize=args.font_size, symbolZoom=args.symbol_zoom, symbolDivision=args.symbol_divisions, showCityName=args.city_name, hideDataCopyright=args.hide_data_copyright, measuredRain=measuredRain, measuredTemperature=measuredTemperature, showSunshine=args.show_sunshine, sunshineBars=args.sunshine_bars, imageFormat=args.image_format, skipUnchanged=args.skip_unchanged)
+
+    if not args.data_only:
+        import forecastGraph
+        if args.symbol_atlas:
+            forecastGraph.setSymbolAtlasDirectory(os.path.join(args.cache_dir, "symbols"))
+        renderContext = forecastGraph.GraphRenderContext() # the locations share the layout, only the data gets replaced
+        executor = forecastGraph.createRenderPool(args.processes) if variants else None
+
+    markers = {} # zip code -> marker of the graph, keeps the rendered graph for marking it again
+    if args.mark_file:
+        import markGraphic
+        for meteoSwissForecast in forecasts:
+            markFile = args.mark_file.replace("{zipCode}", str(meteoSwissForecast.zipCode))
+            markers[meteoSwissForecast.zipCode] = markGraphic.GraphicMarker(None, markFile, utcOffset=utcOffset)
+
+
+    # Collects the data of all locations and generates their graphs, returns False if any location failed
+    @forecastMetrics.timed("updateLocations")
+    def updateLocations():
+        try:
+            forecastDataUrl = forecasts[0].getForecastDataUrl()
+            if len(forecasts) == 1:
+                forecastDataOfLocations = {forecasts[0].zipCode: forecasts[0].collectData(forecastDataUrl=forecastDataUrl, daysToUse=daysToUse, timeFormat=args.time_format, dateFormat=args.date_format, localeAlias=args.locale, showSunshine=showSunshine, rainVariance=rainVariance)}
+            else:
+                forecastDataOfLocations = collectDataForLocations(forecasts, forecastDataUrl=forecastDataUrl, daysToUse=daysToUse, timeFormat=args.time_format, dateFormat=args.date_format, localeAlias=args.locale, showSunshine=showSunshine, rainVariance=rainVariance)
+        except Exception as e:
+            logging.error("An error occurred: %s" % e)
+            return False
+
+        failed = len(forecastDataOfLocations) < len(forecasts)
+
+        if args.data_only:
+            for meteoSwissForecast in forecasts:
+                if meteoSwissForecast.zipCode in forecastDataOfLocations:
+                    forecastDataFile = args.file.replace("{zipCode}", str(meteoSwissForecast.zipCode))
+                    meteoSwissForecast.exportForecastData(limitDataToDays(forecastDataOfLocations[meteoSwissForecast.zipCode], args.days_to_show), forecastDataFile)
+            return not failed
+
+        for meteoSwissForecast in forecasts:
+            if meteoSwissForecast.zipCode not in forecastDataOfLocations:
+                continue
+            forecastData = forecastDataOfLocations[meteoSwissForecast.zipCode]
+            graphFile = args.file.replace("{zipCode}", str(meteoSwissForecast.zipCode))
+            metaFile = args.meta.replace("{zipCode}", str(meteoSwissForecast.zipCode))
+
+            #pprint.pprint(forecastData)
+            if args.export_forecast_data:
+                forecastDataFile = graphFile.replace(".png", ".json")
+                meteoSwissForecast.exportForecastData(limitDataToDays(forecastData, args.days_to_show), forecastDataFile)
+            #forecastData = meteoSwissForecast.importForecastData("./forecast.json")
+
+            renderSpecs = [dict(graphOptions, outputFilename=graphFile, writeMetaData=metaFile, daysToUse=args.days_to_show)]
+            marker = markers.get(meteoSwissForecast.zipCode)
+            if not variants or marker:
+                # The graph to be marked gets rendered in this process, the marker takes it from memory
+                try:
+                    result = meteoSwissForecast.generateGraph(data=limitDataToDays(forecastData, args.days_to_show), outputFilename=graphFile, writeMetaData=metaFile, renderContext=renderContext, returnImage="image" if marker else None, **graphOptions)
+                    if marker:
+                        metaData, image = result
+                        marker.setBaseImage(image, metaData)
+                        marker.mark()
+                except Exception as e:
+                    logging.error("Failed to render the graph of %s: %s" % (meteoSwissForecast.zipCode, e))
+                    failed = True
+                renderSpecs = []
+
+            for variant in variants:
+                renderSpec = dict(graphOptions, daysToUse=args.days_to_show)
+                renderSpec.update(variant)
+                for name in ['outputFilename', 'writeMetaData']:
+                    if renderSpec.get(name):
+                        renderSpec[name] = renderSpec[name].replace("{zipCode}", str(meteoSwissForecast.zipCode))
+                if not renderSpec.get('writeMetaData'):
+                    renderSpec['skipUnchanged'] = False # the fingerprint gets stored in the meta file
+                renderSpecs.append(renderSpec)
+            if not renderSpecs:
+                continue
+            try:
+                for outputFilename, metaData in forecastGraph.renderVariants(meteoSwissForecast, forecastData, renderSpecs, executor=executor):
+                    logging.debug("Rendered %s" % outputFilename)
+            except Exception as e:
+                logging.error("Failed to render the graphs of %s: %s" % (meteoSwissForecast.zipCode, e))
+                failed = True
+        return not failed
+
+
+    succeeded = updateLocations()
+    forecastMetrics.flush()
+
+    if args.watch:
+        # Marks the graphs every minute and generates them again every refresh interval, all in this process
+        lastUpdate = time.time()
+        try:
+            while True:
+                time.sleep(60 - time.time() % 60) # wake up at the start of the next minute
+                if time.time() - lastUpdate >= args.refresh_interval * 60 - 30:
+                    if not args.utc_offset:
+                        utcOffset = getCurrentUtcOffset() # follows the daylight saving time
+                        for meteoSwissForecast in forecasts:
+                            meteoSwissForecast.utcOffset = utcOffset
+                        for marker in markers.values():
+                            marker.utcOffset = utcOffset
+                    lastUpdate = time.time()
+                    updateLocations()
+                    forecastMetrics.flush() # the marks since the last update get reported with it
+                    continue # the markers got updated with the new graphs
+                for zipCode, marker in markers.items():
+                    if marker.baseImage is None:
+                        continue # not rendered yet
+                    try:
+                        marker.mark()
+                    except Exception as e:
+                        logging.error("Failed to mark the graph of %s: %s" % (zipCode, e))
+        except KeyboardInterrupt:
+            pass
+
+    if not args.data_only:
+        renderContext.close()
+        if executor:
+            executor.shutdown()
+
+    if not succeeded:
+        exit(1)
@@ -0,0 +1,135 @@
+import csv
+import json
+import logging
+import os
+import tempfile
+import unicodedata
+
+
+# Point type of the locations identified by a zip code
+zipCodePointType = '2'
+
+# Columns of the metadata kept in the index (if the CSV has them), the names in other languages etc. get dropped
+metadataColumns = ['point_id', 'point_type_id', 'station_abbr', 'postal_code', 'point_name', 'point_height_masl', 'point_coordinates_wgs84_lat', 'point_coordinates_wgs84_lon']
+
+
+# Lower case and without accents, so "Zürich" can be found as "zurich"
+def normalizeName(name):
+    name = unicodedata.normalize('NFKD', name.strip().casefold())
+    return ''.join(c for c in name if not unicodedata.combining(c))
+
+
+"""
+Lookup tables of the point metadata (ogd-local-forecasting_meta_point.csv):
+ - zip code -> points of type 2 (point id, point type, name)
+ - point id -> metadata rows (only the metadataColumns)
+ - normalized name -> points
+The index gets persisted as JSON together with the version of the metadata it got built from.
+"""
+class PointIndex:
+
+    def __init__(self, version, header, rows, zipCodes, names):
+        self.version = version
+        self.header = header
+        self.rows = rows
+        self.zipCodes = zipCodes
+        self.names = names
+        self.pointIdIdx = header.index('point_id')
+        self.pointTypeIdx = header.index('point_type_id')
+        self.pointNameIdx = header.index('point_name')
+        self.pointIds = {}
+        for i, row in enumerate(rows):
+            self.pointIds.setdefault(row[self.pointIdIdx], []).append(i)
+
+
+    def _point(self, i):
+        row = self.rows[i]
+        return (row[self.pointIdIdx], row[self.pointTypeIdx], row[self.pointNameIdx])
+
+
+    """
+    Returns (point id, point type, name) of the zip code or None if it is unknown.
+    """
+    def lookupZipCode(self, zipCode):
+        rows = self.zipCodes.get(str(zipCode))
+        if not rows:
+            return None
+        return self._point(rows[0])
+
+
+    """
+    Returns the metadata (column -> value of the metadataColumns) of a point or None if it is unknown.
+    """
+    def getPointMetadata(self, pointId, pointType=None):
+        for i in self.pointIds.get(str(pointId), []):
+            row = self.rows[i]
+            if pointType is None or row[self.pointTypeIdx] == pointType:
+                return dict(zip(self.header, row))
+        return None
+
+
+    """
+    Returns the points (point id, point type, name) whose name contains the given text.
+    """
+    def searchName(self, text):
+        text = normalizeName(text)
+        if text in self.names:
+            return [self._point(i) for i in self.names[text]]
+        return [self._point(i) for name, rows in self.names.items() if text in name for i in rows]
+
+
+    """
+    Builds the index from the metadata CSV (text handle).
+    """
+    @staticmethod
+    def build(handle, version):
+        reader = csv.reader(handle, delimiter=';')
+        csvHeader = next(reader)
+        columns = [i for i, column in enumerate(csvHeader) if column in metadataColumns]
+        header = [csvHeader[i] for i in columns]
+        pointTypeIdx = csvHeader.index('point_type_id')
+        postalCodeIdx = csvHeader.index('postal_code')
+        pointNameIdx = csvHeader.index('point_name')
+        rows = []
+        zipCodes = {}
+        names = {}
+        for row in reader:
+            if len(row) < len(csvHeader):
+                continue
+            i = len(rows)
+            rows.append([row[j] for j in columns])
+            if row[pointTypeIdx] == zipCodePointType and row[postalCodeIdx]:
+                zipCodes.setdefault(row[postalCodeIdx], []).append(i)
+            names.setdefault(normalizeName(row[pointNameIdx]), []).append(i)
+        logging.debug("Indexed %d points, %d zip codes" % (len(rows), len(zipCodes)))
+        return PointIndex(version, header, rows, zipCodes, names)
+
+
+    def save(self, fileName):
+        data = {'version': self.version, 'header': self.header, 'rows': self.rows, 'zipCodes': self.zipCodes, 'names': self.names}
+        handle, tempName = tempfile.mkstemp(dir=os.path.dirname(fileName), prefix=".tmp-")
+        try:
+            with os.fdopen(handle, 'w') as f:
+                json.dump(data, f)
+            os.replace(tempName, fileName)
+        except BaseException:
+            try:
+                os.remove(tempName)
+            except OSError:
+                pass
+            raise
+
+
+    """
+    Loads a persisted index, returns None if it does not exist or got built from another version.
+    """
+    @staticmethod
+    def load(fileName, version):
+        try:
+            with open(fileName) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != version:
+            return None
+        return PointIndex(version, data['header'], data['rows'], data['zipCodes'], data['names'])
@@ -0,0 +1,69 @@
+import logging
+import re
+
+
+assetPattern = re.compile(r'\.(\d{12})\.(\w+)\.csv$')
+
+
+"""
+Parsed asset index of a STAC items response.
+A run is complete if one item provides all required parameters of it, the latest complete run gets chosen once per response,
+so lookups of the run and of asset URLs are then dict accesses.
+"""
+class StacIndex:
+
+    def __init__(self, items, requiredParameters):
+        self.runs = set()
+        self.assetUrls = {} # (run, parameter) -> href
+        self.latestRun = None
+        self.latestItemId = None
+        self.latestItemAssets = None
+        self.latestAssetUrls = {} # parameter -> href in the latest run providing it of the item of the latest complete run
+        required = set(requiredParameters)
+        latestItemRuns = None
+        for item in items.get('features', []):
+            if not item.get('assets'):
+                continue
+            itemRuns = {} # run -> {parameter: href}
+            for key, asset in item['assets'].items():
+                m = assetPattern.search(key)
+                if not m:
+                    continue
+                run, parameter = m.group(1), m.group(2)
+                itemRuns.setdefault(run, {})[parameter] = asset['href']
+                self.assetUrls.setdefault((run, parameter), asset['href'])
+            self.runs.update(itemRuns)
+            for run, parameters in itemRuns.items():
+                if required.issubset(parameters) and (self.latestRun is None or run > self.latestRun):
+                    self.latestRun = run
+                    self.latestItemId, self.latestItemAssets = item['id'], item['assets']
+                    latestItemRuns = itemRuns
+
+        if latestItemRuns:
+            # The assets of the item with the latest complete run take precedence over the ones of other items
+            for run in sorted(latestItemRuns):
+                for parameter, href in latestItemRuns[run].items():
+                    self.assetUrls[(run, parameter)] = href
+                    self.latestAssetUrls[parameter] = href
+        logging.debug("Indexed %d forecast runs, latest complete run: %s" % (len(self.runs), self.latestRun))
+
+
+    """
+    Returns the latest run providing all required parameters in one item or None.
+    """
+    def getLatestCompleteRun(self):
+        return self.latestRun
+
+
+    """
+    Returns the href of the parameter in the given run,
+    or in the latest run providing it in the item of the latest complete run if run is None.
+    """
+    def getAssetUrl(self, parameter, run=None):
+        if run is None:
+            if parameter not in self.latestAssetUrls:
+                raise Exception("No asset found for parameter %r" % parameter)
+            return self.latestAssetUrls[parameter]
+        if (run, parameter) not in self.assetUrls:
+            raise Exception("Run %r not available for parameter %r" % (run, parameter))
+        return self.assetUrls[(run, parameter)]
@@ -0,0 +1,112 @@
+import logging
+import os
+import tempfile
+import threading
+import numpy as np
+from PIL import Image
+
+
+# Directory of the symbol PNGs, see README.md on how to get them
+symbolDirectory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "symbols")
+
+
+"""
+Decoded weather symbols, resampled to the size they get drawn with.
+Every symbol gets decoded and resampled only once per process and scale.
+With an atlas directory, all symbols of a scale get stored in a single file (<atlas directory>/symbols-<scale>.npz),
+so further processes load them with one read instead of decoding every PNG.
+"""
+class SymbolCache:
+
+    def __init__(self, directory=symbolDirectory, atlasDirectory=None):
+        self.directory = directory
+        self.atlasDirectory = atlasDirectory
+        self.images = {} # scale -> {symbol id -> RGBA array or None if missing}
+        self.lock = threading.Lock()
+
+
+    def _symbolFile(self, symbolId):
+        return os.path.join(self.directory, "%s.png" % symbolId)
+
+
+    def _atlasFile(self, scale):
+        return os.path.join(self.atlasDirectory, "symbols-%.4f.npz" % scale)
+
+
+    # Decodes a symbol and resamples it by the given scale, returns None if the symbol file does not exist
+    def _loadImage(self, symbolId, scale):
+        symbolFile = self._symbolFile(symbolId)
+        try:
+            with Image.open(symbolFile) as image:
+                image = image.convert('RGBA')
+                size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+                return np.asarray(image.resize(size, Image.LANCZOS))
+        except FileNotFoundError:
+            logging.warning("The symbol file %s seems to be missing. Please check the README.md!" % symbolFile)
+            return None
+
+
+    # Returns the newest modification time of the symbol files, an atlas is only valid if it is newer
+    def _sourceTime(self):
+        try:
+            return max((entry.stat().st_mtime for entry in os.scandir(self.directory) if entry.name.endswith(".png")), default=0)
+        except OSError:
+            return 0
+
+
+    def _loadAtlas(self, scale):
+        atlasFile = self._atlasFile(scale)
+        try:
+            if os.path.getmtime(atlasFile) < self._sourceTime():
+                return None
+            with np.load(atlasFile) as atlas:
+                images = {name: atlas[name] for name in atlas.files}
+        except (OSError, ValueError):
+            return None
+        logging.debug("Loaded %d symbols from %s" % (len(images), atlasFile))
+        return images
+
+
+    def _buildAtlas(self, scale):
+        images = {}
+        try:
+            fileNames = os.listdir(self.directory)
+        except OSError:
+            return images
+        for fileName in fileNames:
+            if fileName.endswith(".png"):
+                image = self._loadImage(fileName[:-4], scale)
+                if image is not None:
+                    images[fileName[:-4]] = image
+
+        atlasFile = self._atlasFile(scale)
+        try:
+            os.makedirs(self.atlasDirectory, exist_ok=True)
+            # Write to a temporary file first, so concurrent readers never see a partial atlas
+            handle, tempName = tempfile.mkstemp(dir=self.atlasDirectory, prefix=".tmp-", suffix=".npz")
+            with os.fdopen(handle, 'wb') as f:
+                np.savez(f, **images)
+            os.replace(tempName, atlasFile)
+            logging.debug("Stored %d symbols in %s" % (len(images), atlasFile))
+        except OSError as e:
+            logging.warning("Failed to store the symbol atlas %s: %s" % (atlasFile, e))
+        return images
+
+
+    """
+    Returns the symbol as RGBA array (uint8), resampled by the given scale, or None if the symbol is missing.
+    """
+    def get(self, symbolId, scale):
+        symbolId = str(symbolId)
+        with self.lock:
+            images = self.images.get(scale)
+            if images is None:
+                if self.atlasDirectory:
+                    images = self._loadAtlas(scale)
+                    if images is None:
+                        images = self._buildAtlas(scale)
+                self.images[scale] = images if images is not None else {}
+                images = self.images[scale]
+            if symbolId not in images:
+                images[symbolId] = self._loadImage(symbolId, scale)
+            return images[symbolId]